@@ -25,13 +25,27 @@
 # SOFTWARE.
 
 import RPi.GPIO as GPIO
+import json
 import os
-import time
+import signal
+import socket
+
+PATH = os.path.dirname(os.path.realpath(__file__)) + '/'
+
+# the same socket the running WeatherPiTFT listens on
+config = json.loads(open(PATH + 'config.json').read())
+CONTROL_SOCKET = config.get('CONTROL_SOCKET', '/tmp/WeatherPiTFT.sock')
+
+# BCM pin of an extra button or motion sensor to wake up the sleeping display (e.g. 16) - None to disable
+WAKE_BUTTON = None
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(19, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 GPIO.setup(26, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 
+if WAKE_BUTTON is not None:
+    GPIO.setup(WAKE_BUTTON, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
 
 def shutdown_pi(shutdown):
     print('Button pressed:{} shutdown Pi'.format(shutdown))
@@ -40,20 +54,52 @@ def shutdown_pi(shutdown):
     os.system('sudo shutdown now')
 
 
+def send_command(command, timeout=10):
+    """
+    sends a command to the control socket of the running WeatherPiTFT
+    :return: the answer as dict or None if the app is not reachable
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as control:
+            control.settimeout(timeout)
+            control.connect(CONTROL_SOCKET)
+            control.sendall('{}\n'.format(command).encode('utf-8'))
+            return json.loads(control.makefile('rb').readline().decode('utf-8'))
+    except (OSError, ValueError) as control_ex:
+        print('control socket not reachable: {}'.format(control_ex))
+        return None
+
+
 def restart_service(shutdown):
-    print('Button pressed:{} restart service'.format(shutdown))
+    print('Button pressed:{} reload config and refresh'.format(shutdown))
+
+    answer = send_command('reload_config')
+
+    if answer and answer['ok']:
+        send_command('refresh')
+    else:
+        # fallback if the app is not running or the render loop is stuck
+        print('reload failed: {} - restart service'.format(answer))
+        os.system('sudo service WeatherPiTFT restart')
 
-    os.system('sudo service WeatherPiTFT restart')
+
+def wake_display(wake):
+    print('Button pressed:{} wake up display'.format(wake))
+
+    send_command('wake')
 
 
 GPIO.add_event_detect(19, GPIO.FALLING, callback=restart_service, bouncetime=1000)
 GPIO.add_event_detect(26, GPIO.FALLING, callback=shutdown_pi, bouncetime=1000)
 
+if WAKE_BUTTON is not None:
+    GPIO.add_event_detect(WAKE_BUTTON, GPIO.FALLING, callback=wake_display, bouncetime=1000)
+
 if __name__ == '__main__':
 
     try:
         while True:
-            time.sleep(1)
+            signal.pause()
     except KeyboardInterrupt:
         os.system('sudo service WeatherPiTFT stop')
         GPIO.cleanup()
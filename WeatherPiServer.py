@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# MIT License
+#
+# Copyright (c) 2016 LoveBootCaptain (https://github.com/LoveBootCaptain)
+# Author: Stephan Ansorge aka LoveBootCaptain
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# a small cache server for many WeatherPi_TFT displays at one place - it fetches the weather data from weatherbit.io
+# once and serves it to all displays which point their WEATHERBIT_URL to this server
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+PATH = os.path.dirname(os.path.realpath(__file__)) + '/'
+
+# create logger
+logger = logging.getLogger(__package__)
+logger.setLevel(logging.INFO)
+logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+# create console handler and set level to info
+ch = logging.StreamHandler()
+ch.setLevel(logging.INFO)
+ch.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+logger.addHandler(ch)
+
+config = json.loads(open(PATH + 'config.json').read())
+settings = config.get('CACHE_SERVER', {})
+
+SERVER = config['WEATHERBIT_URL']
+HEADERS = {}
+
+if config['ENV'] == 'DEV':
+    SERVER = config['MOCKSERVER_URL']
+    WEATHERBIT_IO_KEY = config['WEATHERBIT_DEV_KEY']
+    HEADERS = {'X-Api-Key': f'{config["MOCKSERVER_API_KEY"]}'}
+elif config['ENV'] == 'STAGE':
+    WEATHERBIT_IO_KEY = config['WEATHERBIT_DEV_KEY']
+else:
+    WEATHERBIT_IO_KEY = config['WEATHERBIT_IO_KEY']
+
+# seconds until an endpoint gets fetched again from weatherbit.io
+TTL = dict({'/current': 300, '/forecast/daily': 1800, '/subscription/usage': 60}, **settings.get('TTL', {}))
+
+# the longest time a long-polling client is kept waiting for new data
+MAX_WAIT = settings.get('MAX_WAIT', 300)
+
+# entries nobody asked for in this time are not refreshed in the background anymore
+IDLE = settings.get('IDLE', 3600)
+
+# seconds until a failed fetch is tried again, doubled with every failure up to the TTL of the endpoint
+RETRY = settings.get('RETRY', 60)
+
+
+class Entry(object):
+    def __init__(self):
+        self.body = None
+        self.status = None
+        self.fetched = 0
+        self.requested = 0
+        self.version = 0
+        self.failures = 0
+        self.failed = 0
+        self.fetching = threading.Lock()
+
+
+class Cache(object):
+    """
+    the cached answers by endpoint and query - every query is fetched only once at a time, waiting clients get notified
+    as soon as a new version lands
+    """
+    entries = {}
+    lock = threading.Lock()
+    changed = threading.Condition(lock)
+    hits = 0
+    misses = 0
+    upstream = 0
+    errors = 0
+    retries = 0
+    held = 0
+
+    @staticmethod
+    def key(path, query):
+        """
+        :return: the cache key for a request - the api key of the client is replaced by the one of this server
+        """
+        params = urllib.parse.parse_qsl(query)
+
+        return path, tuple(sorted((name, value) for name, value in params if name not in ('key', 'wait')))
+
+    @staticmethod
+    def entry(key):
+        with Cache.lock:
+            entry = Cache.entries.setdefault(key, Entry())
+            entry.requested = time.time()
+
+        return entry
+
+    @staticmethod
+    def fresh(key, entry):
+        return entry.body is not None and time.time() - entry.fetched < TTL[key[0]]
+
+    @staticmethod
+    def backing_off(key, entry):
+        """
+        :return: True while a failed entry waits for its next try - an outage must not burn the api calls this server
+        is there to save
+        """
+        if not entry.failures:
+            return False
+
+        backoff = min(RETRY * 2 ** (entry.failures - 1), max(RETRY, TTL[key[0]]))
+
+        return time.time() - entry.failed < backoff
+
+    @staticmethod
+    def due(key, entry):
+        return not Cache.fresh(key, entry) and not Cache.backing_off(key, entry)
+
+    @staticmethod
+    def get(key):
+        """
+        :return: the cached entry, fetched from weatherbit.io first if it is missing or expired
+        """
+        entry = Cache.entry(key)
+
+        if Cache.fresh(key, entry):
+            Cache.hits += 1
+            return entry
+
+        if Cache.backing_off(key, entry):
+            Cache.held += 1
+            return entry
+
+        Cache.misses += 1
+
+        # only the first client fetches, all others wait for its result
+        with entry.fetching:
+            if Cache.due(key, entry):
+                Cache.fetch(key, entry)
+
+        return entry
+
+    @staticmethod
+    def failure(entry):
+        Cache.errors += 1
+        entry.failures += 1
+        entry.failed = time.time()
+
+    @staticmethod
+    def fetch(key, entry):
+        path, params = key
+        query = urllib.parse.urlencode(params + (('key', WEATHERBIT_IO_KEY),))
+
+        if entry.failures:
+            Cache.retries += 1
+
+        try:
+            response = requests.get(f'{SERVER}{path}?{query}', headers=HEADERS, timeout=10)
+            Cache.upstream += 1
+
+        except requests.RequestException as fetch_ex:
+            Cache.failure(entry)
+            logger.warning(f'fetching {path} failed: {fetch_ex}')
+
+            # serve the last data until weatherbit.io is back, the client shows its own connection state
+            if entry.body is None:
+                entry.status, entry.body = 502, json.dumps({'error': str(fetch_ex)}).encode('utf-8')
+
+            return
+
+        if response.status_code != 200:
+            Cache.failure(entry)
+
+            if entry.status == 200:
+                logger.warning(f'fetching {path} failed with {response.status_code}, keeping the cached data')
+                return
+        else:
+            entry.failures = 0
+
+        with Cache.lock:
+            if response.content != entry.body:
+                entry.version += 1
+                Cache.changed.notify_all()
+
+            entry.status, entry.body = response.status_code, response.content
+            entry.fetched = time.time()
+
+        logger.info(f'fetched {path} version {entry.version} ({response.status_code})')
+
+    @staticmethod
+    def wait(entry, version, timeout):
+        """
+        blocks until the entry has another version than the client already knows
+        :return: True if there is a new version
+        """
+        end = time.time() + timeout
+
+        with Cache.lock:
+            while entry.version == version:
+                remaining = end - time.time()
+                if remaining <= 0 or not Cache.changed.wait(remaining):
+                    return entry.version != version
+
+        return True
+
+    @staticmethod
+    def refresh():
+        """fetches expired entries in the background, so waiting clients get new data without asking"""
+        thread = threading.Timer(settings.get('TICK', 5), Cache.refresh)
+        thread.daemon = True
+        thread.start()
+
+        now = time.time()
+
+        with Cache.lock:
+            expired = [(key, entry) for key, entry in Cache.entries.items()
+                       if now - entry.requested < IDLE and Cache.due(key, entry)]
+
+        for key, entry in expired:
+            with entry.fetching:
+                if Cache.due(key, entry):
+                    Cache.fetch(key, entry)
+
+    @staticmethod
+    def stats():
+        return {
+            'entries': len(Cache.entries),
+            'hits': Cache.hits,
+            'misses': Cache.misses,
+            'upstream': Cache.upstream,
+            'errors': Cache.errors,
+            'retries': Cache.retries,
+            'held': Cache.held
+        }
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == '/stats':
+            return self.answer(200, json.dumps(Cache.stats()).encode('utf-8'))
+
+        if url.path not in TTL:
+            return self.answer(404, json.dumps({'error': f'unknown endpoint: {url.path}'}).encode('utf-8'))
+
+        try:
+            wait = float(dict(urllib.parse.parse_qsl(url.query)).get('wait', 0))
+        except ValueError:
+            wait = None
+
+        # not wait >= 0 is also true for nan
+        if wait is None or not wait >= 0:
+            return self.answer(400, json.dumps({'error': 'wait must be a number of seconds'}).encode('utf-8'))
+
+        key = Cache.key(url.path, url.query)
+        entry = Cache.get(key)
+
+        # long polling: a client that sends the version it already has and a wait time gets an answer as soon as
+        # there is a new version, or a 304 when the time is up
+        known = self.headers.get('If-None-Match', '').strip('"')
+
+        if known == str(entry.version):
+            if wait and Cache.wait(entry, entry.version, min(wait, MAX_WAIT)):
+                return self.answer(entry.status, entry.body, entry.version)
+
+            return self.answer(304, b'', entry.version)
+
+        self.answer(entry.status, entry.body, entry.version)
+
+    def answer(self, status, body, version=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+
+        if version is not None:
+            self.send_header('ETag', f'"{version}"')
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, log_format, *args):
+        logger.debug(f'{self.address_string()} - {log_format % args}')
+
+
+if __name__ == '__main__':
+
+    host = settings.get('HOST', '0.0.0.0')
+    port = settings.get('PORT', 8080)
+
+    server = ThreadingHTTPServer((host, port), CacheHandler)
+    server.daemon_threads = True
+
+    Cache.refresh()
+
+    logger.info(f'cache server for {SERVER} running on {host}:{port}')
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
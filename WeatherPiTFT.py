@@ -24,21 +24,132 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import collections
+import concurrent.futures
+import contextlib
+import ctypes
 import datetime
+import bisect
+import gc
+import http.server
+import importlib.util
 import json
 import locale
 import logging
 import math
+import multiprocessing
 import os
+import queue
 import random
+import socketserver
 import sys
 import threading
 import time
+import tracemalloc
 
-import pygame
-import pygame.gfxdraw
-import requests
-from PIL import Image, ImageDraw
+
+class Startup(object):
+    """
+    records the phases of the startup until the first frame and the first weather data are on the display - it starts
+    before the slow imports and can be saved as chrome trace (open it in chrome://tracing or ui.perfetto.dev)
+    """
+    origin = time.perf_counter()
+    events = []
+    first_frame = False
+    pending = True
+
+    @staticmethod
+    @contextlib.contextmanager
+    def phase(name):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            Startup.events.append((name, start, time.perf_counter(), threading.current_thread()))
+
+    @staticmethod
+    def mark(name):
+        now = time.perf_counter()
+        Startup.events.append((name, now, None, threading.current_thread()))
+
+        logger.info(f'startup: {name} after {round(now - Startup.origin, 2)}s')
+
+    @staticmethod
+    def frame(weather_shown):
+        """
+        called by the render loop after every frame until the weather data is on the display
+        :param weather_shown: True if the frame shows weather data
+        """
+        if not Startup.first_frame:
+            Startup.first_frame = True
+            Startup.mark('first frame')
+
+        if weather_shown:
+            Startup.pending = False
+            Startup.mark('weather data on display')
+            Startup.finish()
+
+    @staticmethod
+    def finish():
+        for name, start, end, thread in Startup.events:
+            if end is not None:
+                logger.info(f'startup: {name} took {round((end - start) * 1000)}ms ({thread.name})')
+
+        if config.get('STARTUP', {}).get('TRACE', False):
+            Startup.save(LOG_PATH + 'startup_trace.json')
+
+    @staticmethod
+    def save(file_name):
+        pid = os.getpid()
+        trace = []
+
+        for name, start, end, thread in Startup.events:
+            event = {'name': name, 'pid': pid, 'tid': thread.ident, 'ts': (start - Startup.origin) * 1000000}
+
+            if end is None:
+                event.update(ph='i', s='g')
+            else:
+                event.update(ph='X', dur=(end - start) * 1000000)
+
+            trace.append(event)
+
+        threads = {thread.ident: thread.name for *_, thread in Startup.events}
+        trace += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': thread_name}}
+                  for ident, thread_name in threads.items()]
+
+        try:
+            with open(file_name, 'w') as trace_file:
+                json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, trace_file)
+
+            logger.info(f'startup trace saved to {file_name}')
+
+        except OSError as trace_ex:
+            logger.warning(f'startup trace not saved: {trace_ex}')
+
+
+def lazy_import(name):
+    """
+    :return: the module, imported the first time one of its attributes is used
+    """
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+with Startup.phase('import pygame'):
+    import pygame
+    import pygame.gfxdraw
+
+with Startup.phase('import PIL'):
+    from PIL import Image, ImageDraw
+
+# only needed for the first fetch in the background, not for the first frame
+requests = lazy_import('requests')
 
 PATH = sys.path[0] + '/'
 ICON_PATH = PATH + '/icons/'
@@ -69,9 +180,6 @@ config = json.loads(config_data)
 
 theme_config = config["THEME"]
 
-theme_settings = open(PATH + theme_config).read()
-theme = json.loads(theme_settings)
-
 SERVER = config['WEATHERBIT_URL']
 HEADERS = {}
 WEATHERBIT_COUNTRY = config['WEATHERBIT_COUNTRY']
@@ -81,9 +189,36 @@ WEATHERBIT_HOURS = config['WEATHERBIT_HOURS']
 WEATHERBIT_DAYS = config['WEATHERBIT_DAYS']
 METRIC = config['LOCALE']['METRIC']
 
-locale.setlocale(locale.LC_ALL, (config['LOCALE']['ISO'], 'UTF-8'))
+with Startup.phase('locale'):
+    locale.setlocale(locale.LC_ALL, (config['LOCALE']['ISO'], 'UTF-8'))
 
 THREADS = []
+THREADS_LOCK = threading.Lock()
+# set by quit_all - no timer chain goes on after that
+STOPPING = threading.Event()
+START_TIME = time.time()
+
+
+def start_timer(interval, function, args=None):
+    """
+    starts a daemon timer and keeps it in THREADS - the ended ones are removed from the list right here
+    :return: the timer or None if the app is quitting
+    """
+    global THREADS
+
+    if STOPPING.is_set():
+        return None
+
+    thread = threading.Timer(interval, function, args)
+    thread.daemon = True
+
+    with THREADS_LOCK:
+        THREADS = [t for t in THREADS if t.is_alive()]
+        THREADS.append(thread)
+
+    thread.start()
+
+    return thread
 
 try:
     # if you do local development you can add a mock server (e.g. from postman.io our your homebrew solution)
@@ -114,41 +249,443 @@ except Exception as e:
     quit()
 
 
-pygame.display.init()
-pygame.mixer.quit()
-pygame.font.init()
-pygame.mouse.set_visible(config['DISPLAY']['MOUSE'])
-pygame.display.set_caption('WeatherPiTFT')
+class Soak(object):
+    """
+    records the fetched weather data and replays it (or random variations of it) with a virtual clock that runs SPEED
+    times faster than the real one - to see memory growth, piling up threads and crashes from bad data of weeks of
+    uptime within minutes
+    """
+    settings = config.get('SOAK', {})
+    record = settings.get('RECORD', False)
+    replay = settings.get('REPLAY', False)
+    path = os.path.join(PATH, settings.get('PATH', 'recordings'))
+    speed = settings.get('SPEED', 500) if replay else 1
+    started = time.time()
+    payloads = []
+    index = 0
+    icons = []
+    frame_times = []
+    reports = []
+    exceptions = 0
+    failures = []
+    next_report = None
+
+    @staticmethod
+    def time():
+        """
+        :return: the virtual time - the real time if no soak test is running
+        """
+        return Soak.started + (time.time() - Soak.started) * Soak.speed
+
+    @staticmethod
+    def start():
+        if not Soak.replay:
+            return
+
+        for recording in sorted(os.listdir(Soak.path)) if os.path.isdir(Soak.path) else []:
+            with open(os.path.join(Soak.path, recording)) as recording_file:
+                Soak.payloads.append(recording_file.read())
+
+        if not Soak.payloads:
+            with open(LOG_PATH + 'latest_weather.json') as latest_file:
+                Soak.payloads.append(latest_file.read())
 
+        Soak.icons = sorted(icon[:4] for icon in os.listdir(ICON_PATH) if icon[3:4] in ('d', 'n'))
 
-def quit_all():
+        # every timer of the fetch and render pipeline runs in virtual time - but not faster than a frame can be
+        # rendered, otherwise the timers pile up waiting for each other
+        for timer in ('UPDATE', 'RELOAD'):
+            config['TIMER'][timer] = max(config['TIMER'][timer] / Soak.speed, 0.1)
 
-    pygame.display.quit()
-    pygame.quit()
+            if config['TIMER'][timer] == 0.1:
+                logger.warning(f'soak test {timer} timer is limited to 0.1s - lower the SPEED for real intervals')
 
-    global THREADS
+        # count what would kill a timer thread in the field instead of printing it between the logs only
+        excepthook = threading.excepthook
 
-    for thread in THREADS:
+        def count(args):
+            Soak.exceptions += 1
+            excepthook(args)
+
+        threading.excepthook = count
+
+        Soak.started = time.time()
+        Soak.next_report = Soak.time()
+
+        logger.info(f'soak test with {len(Soak.payloads)} payloads for {Soak.settings.get("DAYS", 14)} days '
+                    f'at {Soak.speed}x speed')
+
+    @staticmethod
+    def save(data):
+        os.makedirs(Soak.path, exist_ok=True)
+
+        with open(os.path.join(Soak.path, f'{int(time.time())}.json'), 'w') as recording_file:
+            json.dump(data, recording_file)
+
+    @staticmethod
+    def payload():
+        """
+        :return: the next recorded payload moved to the virtual day - with random variations and now and then a
+        broken one if configured
+        """
+        data = json.loads(Soak.payloads[Soak.index % len(Soak.payloads)])
+        Soak.index += 1
+
+        try:
+            days = round((Soak.time() - data['daily']['data'][0]['ts']) / 86400)
+
+            for day in data['daily']['data'] + data['current']['data']:
+                for key in ('ts', 'sunrise_ts', 'sunset_ts'):
+                    if key in day:
+                        day[key] += days * 86400
+
+                if 'datetime' in day and 'ts' in day:
+                    day['datetime'] = time.strftime('%Y-%m-%d', time.localtime(day['ts']))
+
+            if Soak.settings.get('VARY', True):
+                current = data['current']['data'][0]
+                current['temp'] = current['temp'] + random.uniform(-10, 10)
+                current['wind_dir'] = random.randrange(360)
+                current['weather']['icon'] = random.choice(Soak.icons)
+
+                for day in data['daily']['data']:
+                    day['pop'] = random.choice((0, 0, 20, 60, 100))
+                    day['precip'], day['snow'] = random.uniform(0, 10), random.choice((0, random.uniform(0, 10)))
+                    day['weather']['icon'] = random.choice(Soak.icons)
+
+        except (KeyError, IndexError, TypeError) as payload_ex:
+            logger.warning(f'soak payload {Soak.index} is not like a weatherbit.io answer: {payload_ex}')
+
+        if random.random() < Soak.settings.get('MALFORMED', 0):
+            broken = random.choice(('current', 'daily', 'error', 'empty'))
+
+            if broken == 'current':
+                del data['current']['data'][0][random.choice(list(data['current']['data'][0]))]
+            elif broken == 'daily':
+                data['daily']['data'] = data['daily']['data'][:random.randrange(4)]
+            elif broken == 'error':
+                data = {'current': {'error': 'API key not valid.'}, 'daily': {}, 'stats': {}}
+            else:
+                data = {}
+
+            logger.info(f'soak payload {Soak.index} broken: {broken}')
+
+        return data
+
+    @staticmethod
+    def rss():
+        """
+        :return: the resident memory in MB or None if there is no /proc
+        """
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def surfaces():
+        """
+        :return: the number of surfaces held by any object - surfaces are not tracked by the gc themselves
+        """
+        return len({id(referent) for holder in gc.get_objects() for referent in gc.get_referents(holder)
+                    if isinstance(referent, pygame.Surface)})
+
+    @staticmethod
+    def report():
+        frame_times = sorted(Soak.frame_times) or [0]
+        Soak.frame_times = []
+
+        report = {
+            'day': round((Soak.time() - Soak.started) / 86400, 2),
+            'payloads': Soak.index,
+            'rss_mb': Soak.rss(),
+            'threads': threading.active_count(),
+            'timers': len(THREADS),
+            'surfaces': Soak.surfaces(),
+            'exceptions': Soak.exceptions,
+            'frame_ms': {'p50': round(frame_times[len(frame_times) // 2], 2),
+                         'p95': round(frame_times[int(len(frame_times) * 0.95)], 2),
+                         'max': round(frame_times[-1], 2)}
+        }
+
+        Soak.reports.append(report)
+        logger.info(f'soak report: {report}')
+
+    @staticmethod
+    def frame(frame_time):
+        """
+        :param frame_time: the time to render the last frame in ms
+        :return: False when the soak test is over
+        """
+        Soak.frame_times.append(frame_time)
+
+        if Soak.time() >= Soak.next_report:
+            Soak.report()
+            Soak.next_report += Soak.settings.get('REPORT', 21600)
+
+        if Soak.time() - Soak.started < Soak.settings.get('DAYS', 14) * 86400:
+            return True
+
+        Soak.report()
+
+        # compare with the middle of the test, the render caches fill up in the first hours
+        baseline = Soak.reports[len(Soak.reports) // 2]
+        last = Soak.reports[-1]
+        rss_growth = (last['rss_mb'] or 0) - (baseline['rss_mb'] or 0)
+
+        Soak.failures = [failure for failure, failed in (
+            (f'memory grew {round(rss_growth, 1)} MB', rss_growth > Soak.settings.get('RSS_LIMIT', 20)),
+            (f'{last["timers"]} timers left', last['timers'] > Soak.settings.get('TIMER_LIMIT', 20)),
+            (f'surfaces grew from {baseline["surfaces"]} to {last["surfaces"]}',
+             last['surfaces'] > baseline['surfaces'] * 1.2),
+            (f'{last["exceptions"]} exceptions', last['exceptions'] > 0)
+        ) if failed]
+
+        with open(LOG_PATH + 'soak.json', 'w') as soak_file:
+            json.dump({'failures': Soak.failures, 'reports': Soak.reports}, soak_file, indent=2)
+
+        if Soak.failures:
+            logger.warning(f'soak test failed: {Soak.failures}')
+        else:
+            logger.info('soak test passed')
+
+        return False
+
+
+if Soak.replay:
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+
+with Startup.phase('display init'):
+    pygame.display.init()
+    pygame.mixer.quit()
+    pygame.font.init()
+    pygame.mouse.set_visible(config['DISPLAY']['MOUSE'])
+    pygame.display.set_caption('WeatherPiTFT')
+
+
+def quit_all(status=0, restart=False):
+
+    # the timer chains end before pygame, a running timer must not render into a closed display
+    STOPPING.set()
+
+    with THREADS_LOCK:
+        timers = list(THREADS)
+
+    for thread in timers:
         logger.info(f'Thread killed {thread}')
         thread.cancel()
-        thread.join()
 
-    sys.exit()
+        # quit_all may run in a timer itself (memory limit), a fetch is not waited for longer than a moment
+        if thread is not threading.current_thread():
+            thread.join(2)
+
+    Control.stop()
+    Metrics.stop()
+    # the workers of a restarted app would be left behind waiting for jobs
+    Warmup.stop(wait=restart)
+
+    pygame.display.quit()
+    pygame.quit()
+
+    if restart:
+        # a fresh process gets all memory back that a long running one can not return to the system
+        logger.warning('restarting')
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    sys.exit(status)
 
 
 PWM = config['DISPLAY']['PWM']
+BRIGHTNESS_CONFIG = config['DISPLAY'].get('BRIGHTNESS', {})
+
+# hardware pwm channels of the raspberry pi per BCM pin
+PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+
+
+class Brightness(object):
+    def __init__(self, settings: dict):
+        """
+        writes the display brightness directly to the sysfs pwm or backlight interface
+        :param settings: the DISPLAY.BRIGHTNESS options from the config
+        """
+        self.sysfs = settings.get('SYSFS', '/sys')
+        self.backlight = settings.get('BACKLIGHT', False)
+        self.chip = settings.get('PWM_CHIP', 0)
+        self.period = int(settings.get('PWM_PERIOD', 1000000))
+        self.curve = sorted(settings.get('CURVE', [[0, 25], [6, 25], [6.5, 100], [20, 100], [20.5, 25]]))
+        self.sun = settings.get('SUN', False)
+        self.day = settings.get('DAY', 100)
+        self.night = settings.get('NIGHT', 25)
+        self.twilight = settings.get('TWILIGHT', 1800)
+        self.fade_time = settings.get('FADE', 2)
+        self.tick_time = settings.get('TICK', 60)
+
+        self.path = None
+        self.max_value = self.period
+        self.current = None
+        # apply holds it while it fades, so the level is decided by the last one who got it
+        self.lock = threading.RLock()
+
+    def setup(self):
+        """finds the sysfs target for the configured backlight or pwm pin and enables it"""
+        try:
+            if self.backlight:
+                self.path = f'{self.sysfs}/class/backlight/{self.backlight}/brightness'
+                with open(f'{self.sysfs}/class/backlight/{self.backlight}/max_brightness') as max_file:
+                    self.max_value = int(max_file.read())
+
+                logger.info(f'set backlight {self.backlight} for brightness control (max: {self.max_value})')
+
+            elif PWM is not False:
+                channel = PWM_CHANNELS.get(int(PWM), 0)
+                chip_path = f'{self.sysfs}/class/pwm/pwmchip{self.chip}'
+                channel_path = f'{chip_path}/pwm{channel}'
+
+                if not os.path.isdir(channel_path):
+                    self.write(f'{chip_path}/export', channel)
+
+                self.write(f'{channel_path}/period', self.period)
+                self.write(f'{channel_path}/enable', 1)
+                self.path = f'{channel_path}/duty_cycle'
+
+                logger.info(f'set PWM for brightness control to PIN {PWM} (pwmchip{self.chip}/pwm{channel})')
 
-if PWM:
-    logger.info(f'set PWM for brightness control to PIN {PWM}')
-    os.system(f"gpio -g mode {PWM} pwm")
-else:
-    logger.info('no PWM for brightness control configured')
+            else:
+                logger.info('no PWM for brightness control configured')
+
+        except (OSError, ValueError) as setup_ex:
+            self.path = None
+            logger.warning(f'brightness control disabled: {setup_ex}')
+
+        return self.path is not None
+
+    @staticmethod
+    def write(path, value):
+        with open(path, 'w') as sysfs_file:
+            sysfs_file.write(str(value))
+
+    def set(self, level: float):
+        """
+        :param level: brightness in percent (0 - 100)
+        """
+        if self.path is None:
+            return
+
+        level = max(0.0, min(100.0, float(level)))
+
+        try:
+            self.write(self.path, int(self.max_value * level / 100))
+            self.current = level
+        except OSError as write_ex:
+            logger.warning(f'could not set brightness: {write_ex}')
+
+    def fade(self, level: float, duration=None):
+        """
+        fades linearly from the current to the new brightness
+        :param level: brightness in percent (0 - 100)
+        :param duration: fade duration in seconds (default is the configured FADE)
+        """
+        duration = self.fade_time if duration is None else duration
+
+        with self.lock:
+            start = level if self.current is None else self.current
+            steps = max(1, int(duration * 25))
+
+            if start == level:
+                steps = 1
+
+            for step in range(1, steps + 1):
+                self.set(start + (level - start) * step / steps)
+                if step < steps:
+                    time.sleep(duration / steps)
+
+    def target(self, timestamp=None):
+        """
+        :param timestamp: unix timestamp to calculate the brightness for (default now)
+        :return: the brightness in percent from the sun or the day/night curve
+        """
+        timestamp = Soak.time() if timestamp is None else timestamp
+
+        if self.sun:
+            try:
+                today = JSON_DATA['daily']['data'][0]
+                sunrise, sunset = int(today['sunrise_ts']), int(today['sunset_ts'])
+            except (KeyError, IndexError, TypeError, ValueError):
+                pass
+            else:
+                half = self.twilight / 2
+                if timestamp <= sunrise - half or timestamp >= sunset + half:
+                    return self.night
+                if sunrise + half <= timestamp <= sunset - half:
+                    return self.day
+                edge = sunrise if timestamp < sunrise + half else sunset
+                progress = (timestamp - (edge - half)) / self.twilight if self.twilight else 1
+                if edge == sunset:
+                    progress = 1 - progress
+                return self.night + (self.day - self.night) * progress
+
+        now = datetime.datetime.fromtimestamp(timestamp)
+        hour = now.hour + now.minute / 60 + now.second / 3600
+
+        # wrap the curve around midnight so it can be interpolated at any hour
+        points = [[self.curve[-1][0] - 24, self.curve[-1][1]]] + self.curve + [[self.curve[0][0] + 24,
+                                                                                 self.curve[0][1]]]
+        for (start_hour, start_level), (end_hour, end_level) in zip(points, points[1:]):
+            if start_hour <= hour <= end_hour:
+                if end_hour == start_hour:
+                    return end_level
+                return start_level + (end_level - start_level) * (hour - start_hour) / (end_hour - start_hour)
+
+        return self.day
+
+    def tick(self):
+        """scheduler tick - fades to the brightness of the day/night curve"""
+        start_timer(self.tick_time, self.tick)
+
+        self.apply()
+
+    def apply(self, duration=None):
+        """
+        fades to the brightness of the day/night curve - the backlight stays off while the display sleeps
+        :param duration: fade duration in seconds (default is the configured FADE)
+        """
+        with self.lock:
+            level = 0 if Sleep.sleeping else round(self.target(), 1)
+            if level != self.current:
+                logger.info(f'set brightness: {level}, pwm configured: {PWM}')
+                self.fade(level, duration)
+
+    def nudge(self, duration=None):
+        """applies the brightness in the background right now instead of with the next tick"""
+        if self.path is not None:
+            threading.Thread(target=self.apply, args=[duration], daemon=True).start()
+
+    def run(self):
+        if self.setup():
+            self.tick()
+
+
+with Startup.phase('brightness'):
+    brightness = Brightness(BRIGHTNESS_CONFIG)
 
 
 # display settings from theme config
 DISPLAY_WIDTH = int(config["DISPLAY"]["WIDTH"])
 DISPLAY_HEIGHT = int(config["DISPLAY"]["HEIGHT"])
 
+# the output is rotated counterclockwise for displays mounted sideways or upside down - everything else works on the
+# rotated display size, only the output and touch input know about the panel
+ROTATE = config['DISPLAY'].get('ROTATE', 0) % 360
+PANEL_SIZE = (DISPLAY_WIDTH, DISPLAY_HEIGHT)
+
+if ROTATE not in (0, 90, 180, 270):
+    logger.warning(f'ROTATE must be 0, 90, 180 or 270 - {ROTATE} is ignored')
+    ROTATE = 0
+
+if ROTATE in (90, 270):
+    DISPLAY_WIDTH, DISPLAY_HEIGHT = DISPLAY_HEIGHT, DISPLAY_WIDTH
+
 # the drawing area to place all text and img on
 SURFACE_WIDTH = 240
 SURFACE_HEIGHT = 320
@@ -205,63 +742,425 @@ if SCALE != 1:
 FIT_SCREEN = (int((DISPLAY_WIDTH - SURFACE_WIDTH) / 2), int((DISPLAY_HEIGHT - SURFACE_HEIGHT) / 2))
 
 # the real display surface
-tft_surf = pygame.display.set_mode((DISPLAY_WIDTH, DISPLAY_HEIGHT), pygame.NOFRAME if config['ENV'] == 'Pi' else 0)
+with Startup.phase('display mode'):
+    panel_surf = pygame.display.set_mode(PANEL_SIZE, pygame.NOFRAME if config['ENV'] == 'Pi' else 0)
+
+
+def rotate_rect(rect):
+    """
+    :param rect: an area of the tft surface
+    :return: the same area on the rotated panel
+    """
+    x, y, width, height = rect
+
+    if ROTATE == 90:
+        return pygame.Rect(y, DISPLAY_WIDTH - x - width, height, width)
+    elif ROTATE == 180:
+        return pygame.Rect(DISPLAY_WIDTH - x - width, DISPLAY_HEIGHT - y - height, width, height)
+    elif ROTATE == 270:
+        return pygame.Rect(DISPLAY_HEIGHT - y - height, x, height, width)
+
+    return pygame.Rect(rect)
+
+
+def touch_position(pos):
+    """
+    :param pos: a position on the panel from a mouse or touch event
+    :return: the position on the tft surface
+    """
+    x, y = pos
+
+    if ROTATE == 90:
+        return DISPLAY_WIDTH - 1 - y, x
+    elif ROTATE == 180:
+        return DISPLAY_WIDTH - 1 - x, DISPLAY_HEIGHT - 1 - y
+    elif ROTATE == 270:
+        return y, DISPLAY_HEIGHT - 1 - x
+
+    return x, y
+
+
+def present(rects=None):
+    """
+    updates the display - with rotation only the changed areas are rotated piece by piece into the panel surface, a
+    full update goes in bands, so there is never a full frame allocated for the rotation
+    :param rects: the changed areas of the tft surface, None for everything
+    """
+    if not ROTATE:
+        pygame.display.update(rects) if rects is not None else pygame.display.update()
+        return
+
+    panel_rects = []
+
+    for rect in ROTATE_BANDS if rects is None else rects:
+        rect = rect.clip(tft_surf.get_rect())
+
+        if rect.width and rect.height:
+            panel_rect = rotate_rect(rect)
+            panel_surf.blit(pygame.transform.rotate(tft_surf.subsurface(rect), ROTATE), panel_rect)
+            panel_rects.append(panel_rect)
+
+    if rects is None:
+        pygame.display.update()
+    else:
+        pygame.display.update(panel_rects)
+
+
+def surface_factory(size, alpha=False):
+    """
+    creates a surface in the pixel format of the display, so blitting it needs no conversion per pixel
+    :param size: the size of the surface
+    :param alpha: create it with per pixel alpha
+    """
+    if alpha:
+        return pygame.Surface(size, pygame.SRCALPHA).convert_alpha()
+
+    return pygame.Surface(size).convert()
+
+
+def convert_asset(surf):
+    """
+    converts a finished icon or text surface to the display format with rle acceleration - rle makes blitting the
+    mostly transparent assets a lot faster but has to encode the surface again after every change, so it must
+    only be used for surfaces that are never drawn on again (use surface_factory for layers drawn every frame)
+    """
+    surf = surf.convert_alpha()
+    surf.set_alpha(255, pygame.RLEACCEL)
+
+    return surf
+
+
+# the unrotated display, with rotation it is an extra surface that only gets rotated into the panel surface
+tft_surf = surface_factory((DISPLAY_WIDTH, DISPLAY_HEIGHT)) if ROTATE else panel_surf
+ROTATE_BANDS = [pygame.Rect(0, y, DISPLAY_WIDTH, 32) for y in range(0, DISPLAY_HEIGHT, 32)]
 
-# the drawing area - everything will be drawn here before scaling and rendering on the display tft_surf
-display_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
+# the drawing area - everything will be drawn here before rendering on the display tft_surf
+display_surf = surface_factory((SURFACE_WIDTH, SURFACE_HEIGHT))
 # dynamic surface for status bar updates and dynamic values like fps
-dynamic_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
+dynamic_surf = surface_factory((SURFACE_WIDTH, SURFACE_HEIGHT))
 # exclusive surface for the time
-time_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
-# exclusive surface for the mouse/touch events
-mouse_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
-# surface for the weather data - will only be created once if the data is updated from the api
-weather_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
+time_surf = surface_factory((SURFACE_WIDTH, SURFACE_HEIGHT))
+
+# average blit time of every layer in ms
+LAYER_TIMES = {}
+
+
+def timed_blit(layer, target, surf, pos):
+    """
+    blits the surface and keeps a moving average of the time it took
+    :param layer: the name of the layer for the stats
+    """
+    start = time.perf_counter()
+    target.blit(surf, pos)
+    LAYER_TIMES[layer] = LAYER_TIMES.get(layer, 0) * 0.95 + (time.perf_counter() - start) * 1000 * 0.05
+
+
+# everything the renderer needs from one weather update - created once per update and never changed
+WeatherState = collections.namedtuple('WeatherState', ['data', 'icon', 'forecast_icons', 'precip_type',
+                                                       'precip_color', 'connection_error', 'refresh_error',
+                                                       'path_error'])
+
+
+class WeatherSurface(object):
+    def __init__(self, size, transition: dict):
+        """
+        double buffered surface for the weather data - the update thread draws on the back buffer while the render
+        loop blits the front buffer, both get swapped at the start of a frame
+        :param size: the size of both buffers
+        :param transition: the DISPLAY.TRANSITION options from the config
+        """
+        self.front = surface_factory(size)
+        self.back = surface_factory(size)
+        self.state = None
+        self.back_state = None
+        self.ready = False
+        self.lock = threading.Lock()
+        self.previous = None
+        self.started = None
+
+        self.configure(transition)
+
+    def configure(self, transition: dict):
+        """
+        :param transition: the DISPLAY.TRANSITION options from the config - the budget follows the current FPS
+        """
+        # the last front buffer is kept for the transition to the new one, the back buffer is drawn on meanwhile
+        self.effect = transition.get('EFFECT', False)
+        self.duration = transition.get('DURATION', 0.5)
+        self.budget = 1000 / FPS * transition.get('BUDGET', 0.5)
+        self.previous = surface_factory(self.front.get_size()) if self.effect else None
+        self.started = None
+
+    def publish(self, state):
+        """marks the back buffer as finished - must be called while holding the lock"""
+        self.back_state = state
+        self.ready = True
+
+    def swap(self):
+        """
+        called by the render loop - never waits for a drawing update thread
+        :return: True if a new weather surface is in front now
+        """
+        if not self.ready or not self.lock.acquire(blocking=False):
+            return False
+
+        try:
+            # only new weather data gets a transition, not every read of the same data
+            if self.effect and self.state is not None and self.state.data != self.back_state.data:
+                self.previous.blit(self.front, (0, 0))
+                self.started = time.perf_counter()
+
+            self.front, self.back = self.back, self.front
+            self.state = self.back_state
+            self.ready = False
+        finally:
+            self.lock.release()
+
+        return True
+
+    def draw(self, target):
+        """
+        blits the front buffer - blended with the previous one while a transition runs
+        :return: True while a transition runs, the whole display has to be updated then
+        """
+        if self.started is None:
+            timed_blit('weather', target, self.front, (0, 0))
+            return False
+
+        start = time.perf_counter()
+        progress = (start - self.started) / self.duration
+
+        if progress >= 1:
+            self.started = None
+            timed_blit('weather', target, self.front, (0, 0))
+            return True
+
+        if self.effect == 'slide':
+            # ease out, the new surface slides in from the right
+            offset = int(self.front.get_width() * (1 - (1 - progress) ** 2))
+            target.blit(self.previous, (-offset, 0))
+            target.blit(self.front, (self.front.get_width() - offset, 0))
+        else:
+            target.blit(self.previous, (0, 0))
+            self.front.set_alpha(int(255 * progress))
+            target.blit(self.front, (0, 0))
+            self.front.set_alpha(None)
+
+        blend_time = (time.perf_counter() - start) * 1000
+        LAYER_TIMES['weather'] = LAYER_TIMES.get('weather', 0) * 0.95 + blend_time * 0.05
+
+        # never slower than the configured fps - if blending is too slow for this display the transition ends here
+        if blend_time > self.budget:
+            logger.info(f'{self.effect} transition took {round(blend_time, 2)}ms of {round(self.budget, 2)}ms, '
+                        f'skipped the rest')
+            self.started = None
+
+        return True
+
+
+# surface for the weather data - will only be drawn once if the data is updated from the api
+weather = WeatherSurface((SURFACE_WIDTH, SURFACE_HEIGHT), config['DISPLAY'].get('TRANSITION', {}))
 
 clock = pygame.time.Clock()
 
 logger.info(f'display with {DISPLAY_WIDTH}px width and {DISPLAY_HEIGHT}px height is set to {FPS} FPS with AA {AA}')
 
-BACKGROUND = tuple(theme["COLOR"]["BACKGROUND"])
-MAIN_FONT = tuple(theme["COLOR"]["MAIN_FONT"])
-BLACK = tuple(theme["COLOR"]["BLACK"])
-DARK_GRAY = tuple(theme["COLOR"]["DARK_GRAY"])
-WHITE = tuple(theme["COLOR"]["WHITE"])
-RED = tuple(theme["COLOR"]["RED"])
-GREEN = tuple(theme["COLOR"]["GREEN"])
-BLUE = tuple(theme["COLOR"]["BLUE"])
-LIGHT_BLUE = tuple((BLUE[0], 210, BLUE[2]))
-DARK_BLUE = tuple((BLUE[0], 100, 255))
-YELLOW = tuple(theme["COLOR"]["YELLOW"])
-ORANGE = tuple(theme["COLOR"]["ORANGE"])
-VIOLET = tuple(theme["COLOR"]["VIOLET"])
-COLOR_LIST = [BLUE, LIGHT_BLUE, DARK_BLUE]
-
-FONT_MEDIUM = theme["FONT"]["MEDIUM"]
-FONT_BOLD = theme["FONT"]["BOLD"]
-DATE_SIZE = int(theme["FONT"]["DATE_SIZE"] * ZOOM)
-CLOCK_SIZE = int(theme["FONT"]["CLOCK_SIZE"] * ZOOM)
-SMALL_SIZE = int(theme["FONT"]["SMALL_SIZE"] * ZOOM)
-BIG_SIZE = int(theme["FONT"]["BIG_SIZE"] * ZOOM)
-
-FONT_SMALL = pygame.font.Font(FONT_PATH + FONT_MEDIUM, SMALL_SIZE)
-FONT_SMALL_BOLD = pygame.font.Font(FONT_PATH + FONT_BOLD, SMALL_SIZE)
-FONT_BIG = pygame.font.Font(FONT_PATH + FONT_MEDIUM, BIG_SIZE)
-FONT_BIG_BOLD = pygame.font.Font(FONT_PATH + FONT_BOLD, BIG_SIZE)
-DATE_FONT = pygame.font.Font(FONT_PATH + FONT_BOLD, DATE_SIZE)
-CLOCK_FONT = pygame.font.Font(FONT_PATH + FONT_BOLD, CLOCK_SIZE)
-
-WEATHERICON = 'unknown'
-
-FORECASTICON_DAY_1 = 'unknown'
-FORECASTICON_DAY_2 = 'unknown'
-FORECASTICON_DAY_3 = 'unknown'
+
+class RenderCache(object):
+    """
+    small least recently used caches for rendered surfaces - all caches share one memory budget, when it is used up
+    the least recently used surface of all caches is dropped first
+    """
+    caches = []
+    budget = config.get('MEMORY', {}).get('BUDGET', 32) * 1024 ** 2
+    lock = threading.Lock()
+    tick = 0
+
+    def __init__(self, name, max_items=256):
+        """
+        :param name: the name of the cache used for logging and stats
+        :param max_items: the maximum number of surfaces to keep
+        """
+        self.name = name
+        self.max_items = max_items
+        self.items = collections.OrderedDict()
+        self.sizes = {}
+        self.used = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # one lock for all caches, an item may be evicted from any cache
+        self.lock = RenderCache.lock
+
+        RenderCache.caches.append(self)
+
+    def touch(self, key):
+        RenderCache.tick += 1
+        self.used[key] = RenderCache.tick
+        self.items.move_to_end(key)
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.touch(key)
+            return item
+
+    def put(self, key, item):
+        with self.lock:
+            if key in self.items:
+                self.bytes -= self.sizes[key]
+
+            self.items[key] = item
+            self.sizes[key] = item.get_pitch() * item.get_height() if isinstance(item, pygame.Surface) else 0
+            self.bytes += self.sizes[key]
+            self.touch(key)
+
+            while len(self.items) > self.max_items:
+                self.evict()
+
+            while RenderCache.total() > RenderCache.budget:
+                oldest = min((cache for cache in RenderCache.caches if cache.items),
+                             key=lambda cache: cache.used[next(iter(cache.items))])
+
+                # the new item stays even if it is bigger than the whole budget
+                if oldest is self and len(self.items) == 1:
+                    break
+
+                oldest.evict()
+        return item
+
+    def evict(self):
+        key, _ = self.items.popitem(last=False)
+        self.bytes -= self.sizes.pop(key)
+        self.used.pop(key)
+        self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            logger.info(f'{self.name} cache cleared ({len(self.items)} items)')
+            self.items.clear()
+            self.sizes.clear()
+            self.used.clear()
+            self.bytes = 0
+
+    @staticmethod
+    def total():
+        """
+        :return: the bytes of all cached surfaces
+        """
+        return sum(cache.bytes for cache in RenderCache.caches)
+
+    @staticmethod
+    def fits(size):
+        """
+        :param size: the bytes of a new surface
+        :return: True if the surface fits into the budget without dropping another one
+        """
+        return RenderCache.total() + size <= RenderCache.budget
+
+
+# rendered strings per font and color
+TEXT_CACHE = RenderCache('text')
+# resized, rotated and recolored icons
+ICON_CACHE = RenderCache('icon')
+
+theme = {}
+# theme colors and fonts by name for the layout
+COLORS = {}
+FONTS = {}
+
+
+def load_theme(theme_file):
+    """
+    reads the theme file and sets all colors and fonts from it - nothing is changed if the file is invalid
+    :param theme_file: the theme file name in the app folder (e.g. example.theme)
+    :return: a set of the changed theme sections (COLOR, FONT, DATE_FORMAT, LAYOUT)
+    """
+    global theme, COLORS, FONTS, BACKGROUND, MAIN_FONT, BLACK, DARK_GRAY, WHITE, RED, GREEN, BLUE, LIGHT_BLUE, DARK_BLUE, YELLOW, \
+        ORANGE, VIOLET, COLOR_LIST, FONT_MEDIUM, FONT_BOLD, DATE_SIZE, CLOCK_SIZE, SMALL_SIZE, BIG_SIZE, \
+        FONT_SMALL, FONT_SMALL_BOLD, FONT_BIG, FONT_BIG_BOLD, DATE_FONT, CLOCK_FONT
+
+    with open(PATH + theme_file) as theme_settings:
+        new_theme = json.loads(theme_settings.read())
+
+    new_theme.setdefault('LAYOUT', 'default.layout')
+
+    changed = {section for section in ('COLOR', 'FONT', 'DATE_FORMAT', 'LAYOUT')
+               if new_theme[section] != theme.get(section)}
+
+    # read all new values first, so an invalid theme keeps the old colors and fonts
+    colors = {name: tuple(new_theme["COLOR"][name]) for name in
+              ('BACKGROUND', 'MAIN_FONT', 'BLACK', 'DARK_GRAY', 'WHITE', 'RED', 'GREEN', 'BLUE', 'YELLOW', 'ORANGE',
+               'VIOLET')}
+
+    if 'FONT' in changed:
+        font_medium = new_theme["FONT"]["MEDIUM"]
+        font_bold = new_theme["FONT"]["BOLD"]
+        date_size = int(new_theme["FONT"]["DATE_SIZE"] * ZOOM)
+        clock_size = int(new_theme["FONT"]["CLOCK_SIZE"] * ZOOM)
+        small_size = int(new_theme["FONT"]["SMALL_SIZE"] * ZOOM)
+        big_size = int(new_theme["FONT"]["BIG_SIZE"] * ZOOM)
+
+        fonts = {'SMALL': pygame.font.Font(FONT_PATH + font_medium, small_size),
+                 'SMALL_BOLD': pygame.font.Font(FONT_PATH + font_bold, small_size),
+                 'BIG': pygame.font.Font(FONT_PATH + font_medium, big_size),
+                 'BIG_BOLD': pygame.font.Font(FONT_PATH + font_bold, big_size),
+                 'DATE': pygame.font.Font(FONT_PATH + font_bold, date_size),
+                 'CLOCK': pygame.font.Font(FONT_PATH + font_bold, clock_size)}
+    else:
+        fonts = FONTS
+
+    if changed & {'FONT', 'LAYOUT'}:
+        # the widget bounds depend on the font sizes
+        layout = Layout.compile(new_theme['LAYOUT'], fonts)
+
+    if 'FONT' in changed:
+        FONT_MEDIUM, FONT_BOLD = font_medium, font_bold
+        DATE_SIZE, CLOCK_SIZE, SMALL_SIZE, BIG_SIZE = date_size, clock_size, small_size, big_size
+        FONTS = fonts
+        FONT_SMALL, FONT_SMALL_BOLD, FONT_BIG, FONT_BIG_BOLD, DATE_FONT, CLOCK_FONT = fonts.values()
+
+    if 'COLOR' in changed:
+        BACKGROUND = colors["BACKGROUND"]
+        MAIN_FONT = colors["MAIN_FONT"]
+        BLACK = colors["BLACK"]
+        DARK_GRAY = colors["DARK_GRAY"]
+        WHITE = colors["WHITE"]
+        RED = colors["RED"]
+        GREEN = colors["GREEN"]
+        BLUE = colors["BLUE"]
+        LIGHT_BLUE = tuple((BLUE[0], 210, BLUE[2]))
+        DARK_BLUE = tuple((BLUE[0], 100, 255))
+        YELLOW = colors["YELLOW"]
+        ORANGE = colors["ORANGE"]
+        VIOLET = colors["VIOLET"]
+        COLOR_LIST = [BLUE, LIGHT_BLUE, DARK_BLUE]
+        COLORS = dict(colors, LIGHT_BLUE=LIGHT_BLUE, DARK_BLUE=DARK_BLUE)
+
+        # recolored icons depend on the colors only
+        ICON_CACHE.clear()
+
+    if changed & {'COLOR', 'FONT'}:
+        TEXT_CACHE.clear()
+
+    if changed & {'FONT', 'LAYOUT'}:
+        Layout.use(layout)
+
+    theme = new_theme
+
+    logger.info(f'theme loaded: {theme_file} changed: {sorted(changed)}')
+
+    return changed
+
 
 CONNECTION_ERROR = True
 REFRESH_ERROR = True
 PATH_ERROR = True
-PRECIPTYPE = 'NULL'
-PRECIPCOLOR = WHITE
 
 CONNECTION = False
 READING = False
@@ -271,13 +1170,17 @@ JSON_DATA = {}
 
 
 def image_factory(image_path):
+    """
+    :return: the paths of all images by name - the 1000px originals are only decoded while a variant of them is
+    rendered, so they never stay in memory
+    """
     result = {}
     for img in os.listdir(image_path):
         image_id = img.split('.')[0]
         if image_id == "":
             pass
         else:
-            result[image_id] = Image.open(image_path + img)
+            result[image_id] = image_path + img
     return result
 
 
@@ -285,7 +1188,7 @@ class Particles(object):
     def __init__(self):
         self.size = int(20 * ZOOM)
         self.count = 20
-        self.surf = pygame.Surface((self.size, self.size))
+        self.surf = surface_factory((self.size, self.size))
 
     def create_particle_list(self):
 
@@ -302,28 +1205,33 @@ class Particles(object):
             particle_list.append([x, y, w, h, speed, color, direct])
         return particle_list
 
-    def move(self, surf, particle_list):
+    def move(self, surf, particle_list, state):
         # Process each snow flake in the list
         self.surf.fill(BACKGROUND)
         self.surf.set_colorkey(BACKGROUND)
 
-        if not PRECIPTYPE == config['LOCALE']['PRECIP_STR']:
+        if state is None:
+            return
 
-            for i in range(len(particle_list)):
+        precip_type, precip_color = state.precip_type, state.precip_color
+
+        if not precip_type == config['LOCALE']['PRECIP_STR']:
+
+            for i in range(len(particle_list)):
 
                 particle = particle_list[i]
                 x, y, w, h, speed, color, direct = particle
 
                 # Draw the snow flake
-                if PRECIPTYPE == config['LOCALE']['RAIN_STR']:
+                if precip_type == config['LOCALE']['RAIN_STR']:
                     pygame.draw.rect(self.surf, color, (x, y, w, h), 0)
                 else:
-                    pygame.draw.rect(self.surf, PRECIPCOLOR, (x, y, 2, 2), 0)
+                    pygame.draw.rect(self.surf, precip_color, (x, y, 2, 2), 0)
 
                 # Move the snow flake down one pixel
-                particle_list[i][1] += speed if PRECIPTYPE == config['LOCALE']['RAIN_STR'] else 1
+                particle_list[i][1] += speed if precip_type == config['LOCALE']['RAIN_STR'] else 1
                 if random.choice([True, False]):
-                    if PRECIPTYPE == config['LOCALE']['SNOW_STR']:
+                    if precip_type == config['LOCALE']['SNOW_STR']:
                         particle_list[i][0] += 1 if direct else 0
 
                 # If the snow flake has moved off the bottom of the screen
@@ -335,642 +1243,2343 @@ class Particles(object):
                     x = random.randrange(0, self.size)
                     particle_list[i][0] = x
 
-            surf.blit(self.surf, (int(155 * ZOOM), int(140 * ZOOM)))
+            widget = Layout.widgets.get('particles')
+
+            if widget:
+                surf.blit(self.surf, widget.position(self.surf.get_size()))
+
+
+def text_factory(string, font, color):
+    """
+    :return: the rendered string from the text cache
+    """
+    key = (id(font), string, color)
+
+    return TEXT_CACHE.get(key) or TEXT_CACHE.put(key, convert_asset(font.render(string, True, color)))
+
+
+def icon_factory(image, size, fillcolor=None, angle=None):
+    """
+    :param image: image path from the image_factory()
+    :param size: the size of the longer side before zooming
+    :param fillcolor: optional rgb color tuple for the mono colored icons
+    :param angle: optional rotation angle
+    :return: the resized, rotated and recolored icon from the icon cache
+    """
+    zoomed_size = int(size * ZOOM)
+    key = (image, zoomed_size, angle, fillcolor, AA)
+    cached = ICON_CACHE.get(key)
+
+    if cached:
+        return cached
+
+    return ICON_CACHE.put(key, buffer_to_surface(render_icon(image, zoomed_size, fillcolor, angle, AA)))
+
 
+def buffer_to_surface(buffer):
+    """
+    :param buffer: mode, size and raw pixels from render_icon() or render_moon()
+    :return: the surface converted with convert_asset()
+    """
+    mode, size, pixels = buffer
+
+    return convert_asset(pygame.image.fromstring(pixels, size, mode))
+
+
+def render_icon(image, zoomed_size, fillcolor=None, angle=None, aa=False):
+    """
+    resizes, rotates and recolors an icon with PIL only, so it can run in a worker process too
+    :param image: the path to the image file, decoded here and released with the function
+    :return: mode, size and raw pixels of the icon
+    """
+    image = Image.open(image)
+
+    if angle:
+        image = image.rotate(angle, resample=Image.BICUBIC)
 
-class DrawString:
-    def __init__(self, surf, string: str, font, color, y: int):
+    width, height = image.size
+    if width >= height:
+        width, height = (zoomed_size, int(zoomed_size / width * height))
+    else:
+        width, height = (int(zoomed_size / width * height), zoomed_size)
+
+    image = image.resize((width, height), Image.LANCZOS if aa else Image.BILINEAR)
+
+    if fillcolor:
+        # converts the color on an mono colored icon - without touching every pixel in python
+        image = image.convert('RGBA')
+        alpha = image.getchannel('A')
+        filled = Image.new('RGBA', image.size, tuple(fillcolor))
+        filled.putalpha(alpha)
+        # removes some distortion from scaling/zooming
+        image = Image.composite(filled, image, alpha.point(lambda a: 255 if a > 5 else 0))
+
+    return image.mode, image.size, image.tobytes()
+
+
+class Widget(object):
+    def __init__(self, spec: dict, fonts: dict):
         """
-        :param string: the input string
-        :param font: the fonts object
-        :param color: a rgb color tuple
-        :param y: the y position where you want to render the text
+        one element of the layout with its position compiled for the current display - all coordinates in the spec
+        are for the 240x320 base surface and get zoomed once here
+        :param spec: the widget from the layout file
+        :param fonts: the fonts by name to get the height of text widgets
         """
-        self.string = string
-        self.font = font
-        self.color = color
+        self.id = spec['id']
+        self.type = spec.get('type', 'text')
+        self.layer = spec.get('layer', 'weather')
+        self.align = spec.get('align', 'left')
+        self.font = spec.get('font', 'SMALL_BOLD')
+        self.color = spec.get('color')
+        self.image = spec.get('image')
+        self.size = spec.get('size', 0)
+        # the action of a tap on the widget - a control command or page:<name>
+        self.tap = spec.get('tap')
+
+        offset = spec.get('offset', 0) * ZOOM
+        parts = spec.get('parts', 1)
+        part = spec.get('part', 0)
+        part_width = SURFACE_WIDTH / parts
+
+        y = spec.get('y', 0)
         self.y = int(y * ZOOM)
-        self.size = self.font.size(self.string)
-        self.surf = surf
 
-    def left(self, offset=0):
+        if self.align == 'left':
+            self.x = 10 * ZOOM + offset
+            left, right = self.x, SURFACE_WIDTH
+        elif self.align == 'right':
+            self.x = SURFACE_WIDTH - 10 * ZOOM - offset
+            left, right = 0, self.x
+        elif self.align == 'center':
+            self.x = part_width / 2 + part_width * part + offset
+            left, right = part_width * part, part_width * (part + 1)
+        elif self.align == 'middle':
+            # centered in the right third of the surface and vertically centered on y
+            self.x = SURFACE_WIDTH - (SURFACE_WIDTH / 3) / 2
+            left, right = SURFACE_WIDTH / 3 * 2, SURFACE_WIDTH
+        elif self.align == 'position':
+            self.x = spec.get('x', 0) * ZOOM
+            self.y = int((y or 1) * ZOOM)
+            left, right = self.x, self.x + self.size * ZOOM
+        else:
+            raise ValueError(f'unknown align {self.align} for widget {self.id}')
+
+        if self.type == 'text':
+            height = fonts[self.font].get_linesize()
+        else:
+            height = int(self.size * ZOOM)
+
+            # icons are never wider than their size, so the touch region ends right at the icon
+            if self.align == 'left':
+                right = self.x + height
+            elif self.align == 'right':
+                left = self.x - height
+
+        top = self.y - height / 2 if self.align == 'middle' else self.y
+
+        # the area the widget can draw to, used for dirty rects and touch regions
+        self.rect = pygame.Rect(int(left), int(top), math.ceil(right - left), height).clip(
+            pygame.Rect(0, 0, SURFACE_WIDTH, SURFACE_HEIGHT))
+
+    def position(self, size):
+        """
+        :param size: the size of the rendered content
+        :return: the position to blit the content to
+        """
+        width, height = size
+
+        if self.align == 'right':
+            return int(self.x - width), self.y
+        elif self.align == 'center':
+            return int(self.x - width / 2), self.y
+        elif self.align == 'middle':
+            return int(self.x - width / 2), int(self.y - height / 2)
+
+        return int(self.x), self.y
+
+    def render(self, value):
+        """
+        :param value: the content - a string for text, an icon name for images, the angle for wind, the day for the
+        moon - or a tuple of content and color to override the color of the layout
+        :return: a list of rendered surfaces
+        """
+        color = COLORS.get(self.color)
+
+        if isinstance(value, tuple):
+            value, color = value
+
+        if self.type == 'text':
+            return [text_factory(str(value), FONTS[self.font], color)]
+        elif self.type == 'image':
+            return [icon_factory(images[value if self.image is None else self.image], self.size, color)]
+        elif self.type == 'wind':
+            return [icon_factory(images['circle'], self.size, WHITE),
+                    icon_factory(images['arrow'], self.size, color or RED, angle=-value)]
+        elif self.type == 'moon':
+            return [moon_factory(value, int(self.size * ZOOM))]
+
+        return []
+
+    def draw(self, surf, value):
+        for rendered in self.render(value):
+            surf.blit(rendered, self.position(rendered.get_size()))
+
+
+class Layout(object):
+    """
+    the layout from the theme or the default.layout file compiled into widgets with absolute positions
+    """
+    widgets = {}
+    layers = {}
+
+    @staticmethod
+    def compile(spec, fonts):
+        """
+        :param spec: a list of widgets or the file name of a layout file
+        :param fonts: the fonts by name
+        :return: the compiled widgets by id and the widgets per layer
+        """
+        if isinstance(spec, str):
+            with open(PATH + spec) as layout_file:
+                spec = json.loads(layout_file.read())
+
+        widgets = [Widget(widget, fonts) for widget in spec]
+        layers = {}
+
+        for widget in widgets:
+            layers.setdefault(widget.layer, []).append(widget)
+
+        logger.info(f'layout compiled: {len(widgets)} widgets for {SURFACE_WIDTH}x{SURFACE_HEIGHT} (zoom {ZOOM})')
+
+        return {widget.id: widget for widget in widgets}, layers
+
+    @staticmethod
+    def use(layout):
+        Layout.widgets, Layout.layers = layout
+        Touch.build(Layout.widgets)
+
+    @staticmethod
+    def draw(surf, widget_id, value):
+        """draws one widget - widgets missing in the layout are skipped"""
+        widget = Layout.widgets.get(widget_id)
+
+        if widget:
+            widget.draw(surf, value)
+
+    @staticmethod
+    def render(layer, surf, values: dict):
+        """draws all widgets of the layer with their values - widgets without a value are skipped"""
+        for widget in Layout.layers.get(layer, []):
+            if widget.id in values:
+                widget.draw(surf, values[widget.id])
+
+    @staticmethod
+    def rects(*widget_ids):
+        return [Layout.widgets[widget_id].rect for widget_id in widget_ids if widget_id in Layout.widgets]
+
+    @staticmethod
+    def layer_rects(layer):
+        return [widget.rect for widget in Layout.layers.get(layer, [])]
+
+
+class Pages(object):
+    """
+    the views to swipe through - every page is a double buffered surface rendered off-screen by the update thread,
+    so switching to another page is only one blit in the render loop
+    """
+    known = ('overview', 'daily', 'stats')
+    names = [name for name in config['DISPLAY'].get('PAGES', ['overview']) if name in ('overview', 'daily', 'stats')] \
+        or ['overview']
+    # the overview is the weather surface itself, the other pages are layers of the layout with the same name
+    surfaces = {name: weather if name == 'overview' else
+                WeatherSurface((SURFACE_WIDTH, SURFACE_HEIGHT), config['DISPLAY'].get('TRANSITION', {}))
+                for name in names}
+    current = 0
+    changed = False
+    rows = 6
+
+    @staticmethod
+    def name():
+        return Pages.names[Pages.current]
+
+    @staticmethod
+    def surface():
+        return Pages.surfaces[Pages.name()]
+
+    @staticmethod
+    def page_of(layer):
+        """
+        :return: the page the widgets of the layer are drawn on or None if they are drawn on every page
+        """
+        if layer == 'weather':
+            return 'overview'
+
+        return layer if layer in Pages.known else None
+
+    @staticmethod
+    def show(name):
+        """
+        :return: True if another page is shown now
+        """
+        if name not in Pages.names:
+            logger.warning(f'page {name} is not configured in DISPLAY.PAGES')
+            return False
+
+        index = Pages.names.index(name)
+
+        if index == Pages.current:
+            return False
+
+        Pages.current = index
+        Pages.changed = True
+        logger.info(f'page {name}')
+
+        return True
+
+    @staticmethod
+    def step(direction):
+        """
+        :param direction: 1 for the next page, -1 for the previous one
+        :return: the name of the page shown now
+        """
+        Pages.show(Pages.names[(Pages.current + direction) % len(Pages.names)])
+
+        return Pages.name()
+
+    @staticmethod
+    def swap():
+        """
+        swaps all pages besides the overview, which is the weather surface swapped by the render loop itself
+        :return: True if another page or a new surface of the page is in front now
+        """
+        swapped, Pages.changed = Pages.changed, False
+
+        for name, page in Pages.surfaces.items():
+            if page is not weather and page.swap() and name == Pages.name():
+                swapped = True
+
+        return swapped
+
+    @staticmethod
+    def render(state):
+        """
+        draws the pages besides the overview on their back buffers - called by the update thread
+        :param state: the WeatherState of this update
+        """
+        for name, page in Pages.surfaces.items():
+            if page is weather:
+                continue
+
+            values = Pages.daily(state) if name == 'daily' else Pages.stats()
+
+            with page.lock:
+                page.back.fill(BACKGROUND)
+
+                Layout.render(name, page.back, values)
+
+                page.publish(state)
+
+    @staticmethod
+    def daily(state):
+        """
+        :return: the values of the daily page - one row per forecast day
+        """
+        df_forecast = theme["DATE_FORMAT"]["FORECAST_DAY"]
+        values = {}
+
+        for row, day in enumerate(state.data['daily']['data'][:Pages.rows]):
+            day_ts = time.mktime(time.strptime(day['datetime'], '%Y-%m-%d'))
+            icon = str(day['weather']['icon'])
+
+            values[f'daily_day_{row}'] = convert_timestamp(day_ts, df_forecast)
+            values[f'daily_icon_{row}'] = icon if os.path.isfile(ICON_PATH + icon + '.png') else 'unknown'
+            values[f'daily_temp_{row}'] = f"{int(day['low_temp'])} | {int(day['high_temp'])}"
+            values[f'daily_precip_{row}'] = (f"{day['pop']} %", BLUE if day['pop'] else MAIN_FONT)
+
+        return values
+
+    @staticmethod
+    def stats():
+        """
+        :return: the values of the stats page - a snapshot of the control socket stats
+        """
+        stats = get_stats()
+        calls = stats['calls_remaining']
+        rss = Soak.rss()
+
+        def hit_rate(cache):
+            lookups = cache['hits'] + cache['misses']
+            return f'{round(cache["hits"] / lookups * 100)} %' if lookups else '-'
+
+        return {
+            'stats_calls': f'api calls left: {"-" if calls is None else calls} ({stats["fetch"]["provider"]})',
+            'stats_fetch': f'fetch failures: {stats["fetch"]["failures"]} (circuit {stats["fetch"]["circuit"]})',
+            'stats_age': f'data age: {stats["fetch"]["age"]} s',
+            'stats_fps': f'fps: {stats["fps"]}',
+            'stats_memory': f'memory: {round(rss, 1) if rss else "-"} MB (caches {stats["memory"]["caches"]} MB)',
+            'stats_threads': f'timers: {stats["threads"]} threads: {threading.active_count()}',
+            'stats_cache': f'cache hits: text {hit_rate(stats["text_cache"])} icons {hit_rate(stats["icon_cache"])}',
+            'stats_uptime': f'uptime: {datetime.timedelta(seconds=stats["uptime"])}'
+        }
+
+
+class Touch(object):
+    """
+    swipe and tap navigation - the touch regions of all widgets with a tap action are kept in a grid of cells, so a
+    tap only checks the few regions of its cell
+    """
+    cell = max(1, int(40 * ZOOM))
+    index = {}
+    swipe = 40 * ZOOM
+    long_press = 2
+    start = None
+
+    @staticmethod
+    def build(widgets):
+        """
+        sorts the widgets with a tap action into the grid - called whenever a layout is used
+        :param widgets: the compiled widgets by id
+        """
+        index = {}
+
+        for widget in widgets.values():
+            if not widget.tap or not widget.rect:
+                continue
+
+            page = Pages.page_of(widget.layer)
+            rect = widget.rect
+
+            for cell_x in range(rect.left // Touch.cell, (rect.right - 1) // Touch.cell + 1):
+                for cell_y in range(rect.top // Touch.cell, (rect.bottom - 1) // Touch.cell + 1):
+                    index.setdefault((page, cell_x, cell_y), []).append((rect, widget.tap))
+
+        Touch.index = index
+
+    @staticmethod
+    def hit(page, pos):
+        """
+        :param page: the name of the page shown
+        :param pos: the position on the display surface
+        :return: the tap action of the region at the position or None
+        """
+        cell_x, cell_y = pos[0] // Touch.cell, pos[1] // Touch.cell
+
+        for cell_page in (page, None):
+            for rect, action in Touch.index.get((cell_page, cell_x, cell_y), []):
+                if rect.collidepoint(pos):
+                    return action
+
+        return None
+
+    @staticmethod
+    def position(pos):
+        """
+        :return: the touch position on the display surface
+        """
+        x, y = touch_position(pos)
+
+        return int(x - FIT_SCREEN[0]), int(y - FIT_SCREEN[1])
+
+    @staticmethod
+    def down(pos):
+        Touch.start = Touch.position(pos), time.time()
+
+    @staticmethod
+    def up(pos):
+        """
+        a horizontal swipe shows the next or previous page, a long press takes a screenshot and a tap runs the action
+        of the widget below
+        """
+        if Touch.start is None:
+            return
+
+        (start_x, start_y), start_time = Touch.start
+        x, y = Touch.position(pos)
+        Touch.start = None
+
+        if abs(x - start_x) > Touch.swipe and abs(x - start_x) > abs(y - start_y):
+            # swiping to the left shows the next page like turning a page
+            Pages.step(1 if x < start_x else -1)
+
+        elif time.time() - start_time >= Touch.long_press:
+            if Capture.settings.get('TOUCH', False):
+                Capture.screenshot()
+
+        else:
+            action = Touch.hit(Pages.name(), (x, y))
+            if action:
+                Touch.run(action)
+
+    @staticmethod
+    def run(action):
+        """
+        :param action: page:<name> or a command of the control socket
+        """
+        if action.startswith('page:'):
+            Pages.show(action[5:])
+        elif action in Control.commands:
+            Control.commands[action]()
+        else:
+            logger.warning(f'unknown tap action: {action}')
+
+
+with Startup.phase('theme and layout'):
+    load_theme(theme_config)
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        """
+        a prometheus histogram - the hedged requests of the providers observe from several threads at once
+        :param buckets: the upper bounds of the buckets
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def lines(self, name, labels):
+        # a consistent copy, the sum and count of a scrape match its buckets
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        cumulative = 0
+
+        for bucket, bucket_count in zip(self.buckets + ['+Inf'], counts):
+            cumulative += bucket_count
+            yield f'{name}_bucket{{{labels},le="{bucket}"}} {cumulative}'
+
+        yield f'{name}_sum{{{labels}}} {total}'
+        yield f'{name}_count{{{labels}}} {count}'
+
+
+class Metrics(object):
+    """
+    serves the state of the app in the prometheus text format - the render loop and the update timer only write to
+    plain counters, everything else is collected when the metrics are scraped
+    """
+    settings = config.get('METRICS', {})
+    fetch_seconds = {endpoint: Histogram([0.1, 0.25, 0.5, 1, 2.5, 5, 10])
+                     for endpoint in ('current', 'daily', 'usage', 'forecast')}
+    fetch_failures = 0
+    frames = 0
+    frame_times = [0.0] * 300
+    server = None
+
+    @staticmethod
+    def frame(frame_time):
+        """
+        :param frame_time: the time to render the last frame in ms - written by the render loop only
+        """
+        Metrics.frame_times[Metrics.frames % len(Metrics.frame_times)] = frame_time
+        Metrics.frames += 1
+
+    @staticmethod
+    def start():
+        port = Metrics.settings.get('PORT', False)
+
+        if not port:
+            return
+
+        Metrics.server = http.server.ThreadingHTTPServer((Metrics.settings.get('HOST', '0.0.0.0'), port),
+                                                         MetricsHandler)
+        Metrics.server.daemon_threads = True
+
+        threading.Thread(target=Metrics.server.serve_forever, daemon=True).start()
+
+        logger.info(f'metrics on port {port}')
+
+    @staticmethod
+    def stop():
+        if Metrics.server:
+            Metrics.server.shutdown()
+            Metrics.server.server_close()
+            Metrics.server = None
+
+    @staticmethod
+    def gauge(name, help_text, value, metric_type='gauge'):
+        if value is None:
+            return []
+
+        return [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {float(value)}']
+
+    @staticmethod
+    def collect():
+        """
+        :return: all metrics in the prometheus text format
+        """
+        lines = ['# HELP weatherpi_fetch_seconds duration of the requests to the weather api',
+                 '# TYPE weatherpi_fetch_seconds histogram']
+
+        for endpoint, histogram in Metrics.fetch_seconds.items():
+            lines += histogram.lines('weatherpi_fetch_seconds', f'endpoint="{endpoint}"')
+
+        frame_times = sorted(Metrics.frame_times[:Metrics.frames])
+
+        if frame_times:
+            lines += ['# HELP weatherpi_frame_milliseconds render time of the last frames',
+                      '# TYPE weatherpi_frame_milliseconds summary']
+            lines += [f'weatherpi_frame_milliseconds{{quantile="{quantile}"}} '
+                      f'{frame_times[min(int(len(frame_times) * quantile), len(frame_times) - 1)]}'
+                      for quantile in (0.5, 0.9, 0.99)]
+
+        lines += ['# HELP weatherpi_cache_requests_total lookups of the render caches',
+                  '# TYPE weatherpi_cache_requests_total counter']
+
+        for cache in (TEXT_CACHE, ICON_CACHE):
+            lines += [f'weatherpi_cache_requests_total{{cache="{cache.name}",result="hit"}} {cache.hits}',
+                      f'weatherpi_cache_requests_total{{cache="{cache.name}",result="miss"}} {cache.misses}']
+
+        lines += ['# HELP weatherpi_provider_answers_total weather data used from every provider',
+                  '# TYPE weatherpi_provider_answers_total counter']
+        lines += [f'weatherpi_provider_answers_total{{provider="{name}"}} {Providers.answers[name]}'
+                  for name in Providers.backends]
+
+        update_age = Soak.time() - Fetch.fetched if Fetch.fetched else None
+        calls_remaining = JSON_DATA.get('stats', {}).get('calls_remaining') if isinstance(JSON_DATA, dict) else None
+
+        for gauge in (
+                ('weatherpi_fetch_failures_total', 'failed updates from the weather api', Metrics.fetch_failures,
+                 'counter'),
+                ('weatherpi_last_update_age_seconds', 'age of the last good weather data', update_age),
+                ('weatherpi_circuit_open', 'circuit breaker of the weather api is open', Fetch.is_open()),
+                ('weatherpi_connection_error', 'the last update failed', CONNECTION_ERROR),
+                ('weatherpi_refresh_error', 'the weather data could not be read', REFRESH_ERROR),
+                ('weatherpi_path_error', 'an icon of the weather data is missing', PATH_ERROR),
+                ('weatherpi_api_calls_remaining', 'api calls left for today', calls_remaining),
+                ('weatherpi_fps', 'frames per second', clock.get_fps()),
+                ('weatherpi_frames_total', 'rendered frames', Metrics.frames, 'counter'),
+                ('weatherpi_brightness_percent', 'display brightness', brightness.current),
+                ('weatherpi_sleeping', 'the display sleeps', Sleep.sleeping),
+                ('weatherpi_resident_memory_bytes', 'resident memory', (Soak.rss() or 0) * 1024 ** 2 or None),
+                ('weatherpi_cache_bytes', 'memory of the cached surfaces', RenderCache.total()),
+                ('weatherpi_threads', 'running threads', threading.active_count()),
+                ('weatherpi_timers', 'timers in the THREADS list', len(THREADS)),
+                ('weatherpi_uptime_seconds', 'seconds since the start', time.time() - START_TIME)):
+            lines += Metrics.gauge(*gauge)
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = Metrics.collect().encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, log_format, *args):
+        logger.debug(f'metrics {self.address_string()} - {log_format % args}')
+
+
+class Fetch(object):
+    """
+    the fetch policy for the weather api - every request has a timeout, failures are retried with an exponential
+    backoff and after some failures in a row the circuit breaker opens: no request goes out until the backoff is
+    over, then a single probe decides if it closes again
+    """
+    settings = config.get('FETCH', {})
+    failures = 0
+    fetched = None
+    # the monotonic time the backoff of the last failure is over
+    retry_at = 0
+
+    # the last good data of the last run is the start for the age of the data
+    if os.path.isfile(LOG_PATH + 'latest_weather.json'):
+        fetched = os.path.getmtime(LOG_PATH + 'latest_weather.json')
+
+    @staticmethod
+    def get(request_url, endpoint, headers=None):
+        """
+        :param endpoint: the name of the endpoint for the metrics
+        :param headers: the request headers, the HEADERS for weatherbit.io or the mock server by default
+        :return: the json answer of the api - error answers raise like connection errors
+        """
+        start = time.perf_counter()
+
+        try:
+            response = requests.get(request_url, headers=HEADERS if headers is None else headers,
+                                    timeout=Fetch.settings.get('TIMEOUT', 10))
+        finally:
+            Metrics.fetch_seconds[endpoint].observe(time.perf_counter() - start)
+
+        response.raise_for_status()
+        data = response.json()
+
+        if not isinstance(data, dict) or 'error' in data:
+            raise ValueError(f'api error: {data}')
+
+        return data
+
+    @staticmethod
+    def is_open():
+        return Fetch.failures >= Fetch.settings.get('BREAKER', 3)
+
+    @staticmethod
+    def allow():
+        """
+        :return: True if a request may go out - while the circuit breaker is open manual and long polling refreshes
+        are blocked, the first request after the backoff is the probe whose answer closes or opens it again
+        """
+        if not Fetch.is_open():
+            return True
+
+        if time.monotonic() < Fetch.retry_at:
+            logger.info(f'circuit breaker open, next try in {round(Fetch.retry_at - time.monotonic())}s')
+            return False
+
+        logger.info('circuit breaker half open, probing the api')
+
+        return True
+
+    @staticmethod
+    def success():
+        if Fetch.is_open():
+            logger.info('circuit breaker closed, the api is back')
+
+        Fetch.failures = 0
+        Fetch.fetched = Soak.time()
+
+    @staticmethod
+    def failure():
+        Fetch.failures += 1
+        Metrics.fetch_failures += 1
+
+        if Fetch.failures == Fetch.settings.get('BREAKER', 3):
+            logger.warning(f'circuit breaker open after {Fetch.failures} failures')
+
+        # the backoff gets some jitter so many displays don't come back all at once
+        backoff = min(Fetch.settings.get('BACKOFF', 30) * 2 ** (Fetch.failures - 1),
+                      Fetch.settings.get('MAX_BACKOFF', 3600))
+        jitter = Fetch.settings.get('JITTER', 0.25)
+
+        backoff = backoff * random.uniform(1 - jitter, 1 + jitter)
+        Fetch.retry_at = time.monotonic() + backoff
+
+        logger.info(f'next fetch in {round(backoff)}s after {Fetch.failures} failures')
+
+    @staticmethod
+    def interval():
+        """
+        :return: the seconds until the next fetch - the update timer, or what is left of the backoff after failures
+        """
+        if not Fetch.failures:
+            return config['TIMER']['UPDATE']
+
+        return max(Fetch.retry_at - time.monotonic(), 0)
+
+    @staticmethod
+    def age():
         """
-        :param offset: define some offset pixel to move strings a little bit more left (default=0)
+        :return: the age of the weather data as short string if it is older than STALE seconds, otherwise None
         """
+        if Fetch.fetched is None:
+            return None
+
+        age = Soak.time() - Fetch.fetched
+
+        if age < Fetch.settings.get('STALE', 1800):
+            return None
+        elif age < 3600:
+            return f'{int(age / 60)} min'
+        elif age < 86400:
+            return f'{int(age / 3600)} h'
+
+        return f'{int(age / 86400)} d'
+
+
+class Weatherbit(object):
+    """
+    weatherbit.io - its answers are the common model of the app, every other provider is mapped onto them
+    """
+    name = 'weatherbit'
+
+    @staticmethod
+    def fetch():
+        current_endpoint = f'{SERVER}/current'
+        daily_endpoint = f'{SERVER}/forecast/daily'
+        stats_endpoint = f'{SERVER}/subscription/usage'
+
+        logger.info(f'connecting to server: {SERVER}')
+
+        options = Update.options()
+
+        current_request_url = str(f'{current_endpoint}?key={WEATHERBIT_IO_KEY}{options}')
+        daily_request_url = str(f'{daily_endpoint}?key={WEATHERBIT_IO_KEY}{options}&days={WEATHERBIT_DAYS}')
+        stats_request_url = str(f'{stats_endpoint}?key={WEATHERBIT_IO_KEY}')
+
+        current_data = Fetch.get(current_request_url, 'current')
+        daily_data = Fetch.get(daily_request_url, 'daily')
+        stats_data = Fetch.get(stats_request_url, 'usage')
+
+        return {
+            'current': current_data,
+            'daily': daily_data,
+            'stats': stats_data
+        }
+
+
+class OpenMeteo(object):
+    """
+    open-meteo.com - free and without an api key, but it needs the coordinates instead of the postal code and has no
+    translated descriptions
+    """
+    name = 'openmeteo'
+
+    # the wmo weather codes of open-meteo mapped to the weatherbit icons
+    icons = {0: 'c01', 1: 'c02', 2: 'c03', 3: 'c04', 45: 'a05', 48: 'a06', 51: 'd01', 53: 'd02', 55: 'd03', 56: 'f01',
+             57: 'f01', 61: 'r01', 63: 'r02', 65: 'r03', 66: 'f01', 67: 'f01', 71: 's01', 73: 's02', 75: 's03',
+             77: 's02', 80: 'r04', 81: 'r05', 82: 'r06', 85: 's01', 86: 's03', 95: 't02', 96: 't05', 99: 't05'}
+    descriptions = {0: 'Clear sky', 1: 'Mainly clear', 2: 'Partly cloudy', 3: 'Overcast clouds', 45: 'Fog',
+                    48: 'Freezing fog', 51: 'Light drizzle', 53: 'Drizzle', 55: 'Heavy drizzle',
+                    56: 'Freezing drizzle', 57: 'Freezing drizzle', 61: 'Light rain', 63: 'Moderate rain',
+                    65: 'Heavy rain', 66: 'Freezing rain', 67: 'Freezing rain', 71: 'Light snow', 73: 'Snow',
+                    75: 'Heavy snow', 77: 'Snow grains', 80: 'Light shower rain', 81: 'Shower rain',
+                    82: 'Heavy shower rain', 85: 'Light snow shower', 86: 'Heavy snow shower', 95: 'Thunderstorm',
+                    96: 'Thunderstorm with hail', 99: 'Thunderstorm with heavy hail'}
+    directions = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+
+    @staticmethod
+    def fetch():
+        settings = config.get('PROVIDER', {}).get('OPENMETEO', {})
+        server = settings.get('URL', 'https://api.open-meteo.com/v1')
+
+        if 'LATITUDE' not in settings or 'LONGITUDE' not in settings:
+            raise ValueError('open-meteo needs LATITUDE and LONGITUDE in PROVIDER.OPENMETEO')
+
+        units = '&temperature_unit=celsius&wind_speed_unit=ms&precipitation_unit=mm' if METRIC else \
+            '&temperature_unit=fahrenheit&wind_speed_unit=mph&precipitation_unit=inch'
+
+        request_url = str(f'{server}/forecast?latitude={settings["LATITUDE"]}&longitude={settings["LONGITUDE"]}'
+                          f'&current=temperature_2m,weather_code,wind_speed_10m,wind_direction_10m,is_day'
+                          f'&daily=weather_code,temperature_2m_max,temperature_2m_min,precipitation_probability_max,'
+                          f'rain_sum,showers_sum,snowfall_sum,sunrise,sunset'
+                          f'&forecast_days={WEATHERBIT_DAYS}&timezone=auto&timeformat=unixtime{units}')
+
+        logger.info(f'connecting to server: {server}')
+
+        answer = Fetch.get(request_url, 'forecast', headers={})
+
+        try:
+            return OpenMeteo.convert(answer)
+        except (KeyError, IndexError, TypeError) as convert_ex:
+            raise ValueError(f'unexpected answer from open-meteo: {convert_ex!r}')
+
+    @staticmethod
+    def weather(code, suffix):
+        code = int(code)
+        icon = f'{OpenMeteo.icons[code]}{suffix}' if code in OpenMeteo.icons else 'unknown'
+
+        return {'icon': icon, 'description': OpenMeteo.descriptions.get(code, f'weather code {code}')}
+
+    @staticmethod
+    def convert(answer):
+        """
+        :param answer: the json answer of open-meteo
+        :return: the weather data in the weatherbit model
+        """
+        current, daily = answer['current'], answer['daily']
+        offset = answer.get('utc_offset_seconds', 0)
+        wind_dir = float(current['wind_direction_10m'])
+
+        days = []
+
+        for index, day_ts in enumerate(daily['time']):
+            days.append({
+                'ts': day_ts,
+                'datetime': time.strftime('%Y-%m-%d', time.gmtime(day_ts + offset)),
+                'high_temp': daily['temperature_2m_max'][index],
+                'low_temp': daily['temperature_2m_min'][index],
+                'pop': daily['precipitation_probability_max'][index] or 0,
+                # weatherbit has the liquid precipitation and the snow in mm, open-meteo the snow in cm
+                'precip': (daily['rain_sum'][index] or 0) + (daily['showers_sum'][index] or 0),
+                'snow': (daily['snowfall_sum'][index] or 0) * (10 if METRIC else 1),
+                'sunrise_ts': daily['sunrise'][index],
+                'sunset_ts': daily['sunset'][index],
+                'weather': OpenMeteo.weather(daily['weather_code'][index], 'd')
+            })
+
+        return {
+            'current': {'data': [{
+                'temp': current['temperature_2m'],
+                'wind_spd': current['wind_speed_10m'],
+                'wind_dir': round(wind_dir),
+                'wind_cdir': OpenMeteo.directions[int(wind_dir % 360 / 22.5 + 0.5) % 16],
+                'weather': OpenMeteo.weather(current['weather_code'], 'd' if current.get('is_day', 1) else 'n')
+            }]},
+            'daily': {'data': days},
+            # no api calls to count
+            'stats': {}
+        }
+
+
+class Providers(object):
+    """
+    the weather providers by name - with a SECONDARY provider the requests are hedged: if the PRIMARY has not answered
+    after HEDGE seconds or failed, the secondary is asked as well and the first good answer wins
+    """
+    backends = {provider.name: provider for provider in (Weatherbit, OpenMeteo)}
+    # no threads are started before the first hedged request, so the warm up can still fork
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='provider')
+    answers = collections.Counter()
+
+    @staticmethod
+    def get(name):
+        if name not in Providers.backends:
+            raise ValueError(f'unknown weather provider: {name}')
+
+        return Providers.backends[name]
+
+    @staticmethod
+    def fetch():
+        """
+        :return: the weather data in the common model from the first provider that answered
+        """
+        settings = config.get('PROVIDER', {})
+        primary = Providers.get(settings.get('PRIMARY', 'weatherbit'))
+        secondary = Providers.get(settings['SECONDARY']) if settings.get('SECONDARY') else None
+
+        if secondary is None or secondary is primary:
+            return Providers.answer(primary, primary.fetch())
+
+        futures = {Providers.pool.submit(primary.fetch): primary}
+        done, _ = concurrent.futures.wait(futures, timeout=settings.get('HEDGE', 2))
+
+        if not done or next(iter(done)).exception():
+            logger.info(f'no good answer from {primary.name} yet, asking {secondary.name} as well')
+            futures[Providers.pool.submit(secondary.fetch)] = secondary
+
+        error = None
+
+        # a slow primary keeps running until its timeout, but its answer is not waited for anymore
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                return Providers.answer(futures[future], future.result())
+            except (requests.RequestException, ValueError) as provider_ex:
+                logger.warning(f'{futures[future].name} failed: {provider_ex}')
+                error = provider_ex
+
+        raise error
+
+    @staticmethod
+    def answer(provider, data):
+        Providers.answers[provider.name] += 1
+        data['provider'] = provider.name
+
+        return data
+
+
+class Update(object):
+    update_timer = None
+    read_timer = None
+    # only one fetch at a time - a timer or refresh that comes while one is running leaves it to the running one
+    fetching = threading.Lock()
+    reading = threading.Lock()
+
+    @staticmethod
+    def update_json():
+
+        if STOPPING.is_set():
+            return
+
+        if not Update.fetching.acquire(blocking=False):
+            logger.info('a fetch is already running')
+            return
+
+        try:
+            if Fetch.allow():
+                Update.fetch_json()
+
+        finally:
+            # the next fetch is planned after this one is done, whatever happened - after failures it backs off
+            Update.schedule('update_timer', Fetch.interval(), Update.update_json)
+            Update.fetching.release()
+
+    @staticmethod
+    def fetch_json():
+
+        global CONNECTION_ERROR, CONNECTION
+
+        CONNECTION = pygame.time.get_ticks() + 1500  # 1.5 seconds
+
+        try:
+
+            if Soak.replay:
+                data = Soak.payload()
+            else:
+                data = Providers.fetch()
+
+                if Soak.record:
+                    Soak.save(data)
+
+            # write to a temp file first so read_json never gets a half written file
+            with open(LOG_PATH + 'latest_weather.json.tmp', 'w+') as outputfile:
+                json.dump(data, outputfile, indent=2, sort_keys=True)
+
+            os.replace(LOG_PATH + 'latest_weather.json.tmp', LOG_PATH + 'latest_weather.json')
+
+            logger.info('json file saved')
+
+            CONNECTION_ERROR = False
+
+            Fetch.success()
+
+        except (requests.RequestException, ValueError) as update_ex:
+
+            CONNECTION_ERROR = True
+
+            Fetch.failure()
+
+            logger.warning(f'Connection ERROR: {update_ex}')
+
+    @staticmethod
+    def schedule(timer, interval, function):
+        """
+        replaces the pending timer of the update or the read chain, so there is never more than one of each
+        :param timer: the name of the timer attribute
+        """
+        pending = getattr(Update, timer)
+
+        if pending:
+            pending.cancel()
+
+        setattr(Update, timer, start_timer(interval, function))
+
+    @staticmethod
+    def options():
+        units = 'M' if METRIC else 'I'
+
+        return str(f'&postal_code={WEATHERBIT_POSTALCODE}'
+                   f'&country={WEATHERBIT_COUNTRY}'
+                   f'&lang={WEATHERBIT_LANG}'
+                   f'&units={units}')
+
+    @staticmethod
+    def read_json():
+
+        if STOPPING.is_set():
+            return
+
+        # one read at a time - with the short timers of a soak test the next tick comes while the last one renders
+        if not Update.reading.acquire(blocking=False):
+            logger.info('the weather data is already read')
+            return
+
+        try:
+            Update.load_json()
+
+        finally:
+            Update.schedule('read_timer', config["TIMER"]["RELOAD"], Update.read_json)
+            Update.reading.release()
+
+    @staticmethod
+    def load_json():
+
+        global JSON_DATA, REFRESH_ERROR, READING
+
+        READING = pygame.time.get_ticks() + 1500  # 1.5 seconds
+
+        try:
+
+            data = open(LOG_PATH + 'latest_weather.json').read()
+
+            new_json_data = json.loads(data)
+
+            logger.info('json file read by module')
+            logger.info(f'{new_json_data}')
+
+            JSON_DATA = new_json_data
+
+            REFRESH_ERROR = False
+
+        except (IOError, ValueError) as read_ex:
+
+            REFRESH_ERROR = True
+
+            logger.warning(f'ERROR - json file read by module: {read_ex}')
+
+        try:
+
+            Update.icon_path()
+
+        except (KeyError, IndexError, TypeError, ValueError) as data_ex:
+
+            REFRESH_ERROR = True
+
+            logger.warning(f'ERROR - weather data not usable, keeping the last update: {data_ex}')
+
+    @staticmethod
+    def icon_path():
+
+        # work on one snapshot of the data for the whole update
+        data = JSON_DATA
+
+        icon_extension = '.png'
+
+        updated_list = []
+
+        icon = data['current']['data'][0]['weather']['icon']
+
+        forecast_icon_1 = data['daily']['data'][1]['weather']['icon']
+        forecast_icon_2 = data['daily']['data'][2]['weather']['icon']
+        forecast_icon_3 = data['daily']['data'][3]['weather']['icon']
+
+        forecast = (str(icon), str(forecast_icon_1), str(forecast_icon_2), str(forecast_icon_3))
+
+        logger.debug(forecast)
+
+        logger.debug(f'validating path: {forecast}')
+
+        for icon in forecast:
+
+            if os.path.isfile(ICON_PATH + icon + icon_extension):
+
+                logger.debug(f'TRUE : {icon}')
+
+                updated_list.append(icon)
+
+            else:
+
+                logger.warning(f'FALSE : {icon}')
+
+                updated_list.append('unknown')
+
+        global PATH_ERROR
+
+        if any("unknown" in s for s in updated_list):
+
+            PATH_ERROR = True
+
+        else:
+
+            PATH_ERROR = False
+
+        logger.info(f'update path for icons: {updated_list}')
+
+        Update.get_precip_type(data, updated_list)
+
+    @staticmethod
+    def get_precip_type(data, icons):
+
+        # keep the last precipitation type if rain and snow are equal
+        last_state = weather.back_state or weather.state
+        precip_type, precip_color = (last_state.precip_type, last_state.precip_color) if last_state else ('NULL', WHITE)
+
+        pop = int(data['daily']['data'][0]['pop'])
+        rain = float(data['daily']['data'][0]['precip'])
+        snow = float(data['daily']['data'][0]['snow'])
+
+        if pop == 0:
+
+            precip_type = config['LOCALE']['PRECIP_STR']
+            precip_color = GREEN
+
+        else:
+
+            if pop > 0 and rain > snow:
+
+                precip_type = config['LOCALE']['RAIN_STR']
+                precip_color = BLUE
+
+            elif pop > 0 and snow > rain:
+
+                precip_type = config['LOCALE']['SNOW_STR']
+                precip_color = WHITE
+
+        logger.info(f'update PRECIPPOP to: {pop} %')
+        logger.info(f'update PRECIPTYPE to: {precip_type}')
+        logger.info(f'update PRECIPCOLOR to: {precip_color}')
+
+        state = WeatherState(data=data, icon=icons[0], forecast_icons=tuple(icons[1:]), precip_type=precip_type,
+                             precip_color=precip_color, connection_error=CONNECTION_ERROR,
+                             refresh_error=REFRESH_ERROR, path_error=PATH_ERROR)
+
+        Update.create_surface(state)
+
+    @staticmethod
+    def create_surface(state):
+        """
+        draws the weather data of the state on the back buffer of the weather surface
+        :param state: the WeatherState of this update
+        """
+
+        current_forecast = state.data['current']['data'][0]
+        daily_forecast = state.data['daily']['data']
+        stats_data = state.data.get('stats', {})
+
+        summary_string = current_forecast['weather']['description']
+        temp_out = str(int(current_forecast['temp']))
+        temp_out_unit = '°C' if METRIC else '°F'
+        temp_out_string = str(temp_out + temp_out_unit)
+        precip = daily_forecast[0]['pop']
+        precip_string = str(f'{precip} %')
+
+        today = daily_forecast[0]
+        day_1 = daily_forecast[1]
+        day_2 = daily_forecast[2]
+        day_3 = daily_forecast[3]
+
+        df_forecast = theme["DATE_FORMAT"]["FORECAST_DAY"]
+        df_sun = theme["DATE_FORMAT"]["SUNRISE_SUNSET"]
+
+        day_1_ts = time.mktime(time.strptime(day_1['datetime'], '%Y-%m-%d'))
+        day_1_ts = convert_timestamp(day_1_ts, df_forecast)
+        day_2_ts = time.mktime(time.strptime(day_2['datetime'], '%Y-%m-%d'))
+        day_2_ts = convert_timestamp(day_2_ts, df_forecast)
+        day_3_ts = time.mktime(time.strptime(day_3['datetime'], '%Y-%m-%d'))
+        day_3_ts = convert_timestamp(day_3_ts, df_forecast)
+
+        day_1_min_max_temp = f"{int(day_1['low_temp'])} | {int(day_1['high_temp'])}"
+        day_2_min_max_temp = f"{int(day_2['low_temp'])} | {int(day_2['high_temp'])}"
+        day_3_min_max_temp = f"{int(day_3['low_temp'])} | {int(day_3['high_temp'])}"
+
+        sunrise = convert_timestamp(today['sunrise_ts'], df_sun)
+        sunset = convert_timestamp(today['sunset_ts'], df_sun)
+
+        wind_direction = str(current_forecast['wind_cdir'])
+        wind_speed = float(current_forecast['wind_spd'])
+        wind_speed = wind_speed * 3.6 if METRIC else wind_speed
+        wind_speed_unit = 'km/h' if METRIC else 'mph'
+        wind_speed_string = str(f'{round(wind_speed, 1)} {wind_speed_unit}')
+
+        values = {
+            'connection': ('wifi', RED if state.connection_error else GREEN),
+            'refresh': ('refresh', RED if state.refresh_error else GREEN),
+            'path': ('path', RED if state.path_error else GREEN),
+            'icon': state.icon,
+            'forecast_icon_1': state.forecast_icons[0],
+            'forecast_icon_2': state.forecast_icons[1],
+            'forecast_icon_3': state.forecast_icons[2],
+            'sunrise_icon': 'sunrise',
+            'sunset_icon': 'sunset',
+            'wind': current_forecast['wind_dir'],
+            'moon': today,
+            'summary': summary_string,
+            'temperature': temp_out_string,
+            'precip': (precip_string, state.precip_color),
+            'precip_type': (state.precip_type, state.precip_color),
+            'forecast_day_1': day_1_ts,
+            'forecast_day_2': day_2_ts,
+            'forecast_day_3': day_3_ts,
+            'forecast_temp_1': day_1_min_max_temp,
+            'forecast_temp_2': day_2_min_max_temp,
+            'forecast_temp_3': day_3_min_max_temp,
+            'sunrise': sunrise,
+            'sunset': sunset,
+            'wind_direction': wind_direction,
+            'wind_speed': wind_speed_string
+        }
+
+        if not ANIMATION:
+            if state.precip_type == config['LOCALE']['RAIN_STR']:
+                values['precip_icon'] = 'preciprain'
+            elif state.precip_type == config['LOCALE']['SNOW_STR']:
+                values['precip_icon'] = 'precipsnow'
+
+        # only weatherbit.io counts the api calls
+        if config["DISPLAY"]["SHOW_API_STATS"] and 'calls_remaining' in stats_data:
+            values['api_calls'] = str(stats_data['calls_remaining'])
+
+        global UPDATING
+
+        with weather.lock:
+            weather.back.fill(BACKGROUND)
+
+            Layout.render('weather', weather.back, values)
+
+            weather.publish(state)
+
+        Pages.render(state)
+
+        logger.info(f'summary: {summary_string}')
+        logger.info(f'temp out: {temp_out_string}')
+        logger.info(f'{state.precip_type}: {precip_string}')
+        logger.info(f'icon: {state.icon}')
+        logger.info(f'forecast: '
+                    f'{day_1_ts} {day_1_min_max_temp} {state.forecast_icons[0]}; '
+                    f'{day_2_ts} {day_2_min_max_temp} {state.forecast_icons[1]}; '
+                    f'{day_3_ts} {day_3_min_max_temp} {state.forecast_icons[2]}')
+        logger.info(f'sunrise: {sunrise} ; sunset {sunset}')
+        logger.info(f'WindSpeed: {wind_speed_string}')
+
+        UPDATING = pygame.time.get_ticks() + 1500  # 1.5 seconds
+
+    @staticmethod
+    def run():
+        Update.update_json()
+        Update.read_json()
+
+    @staticmethod
+    def refresh():
+        """fetches, reads and renders the weather data right now - unless the circuit breaker is open"""
+        threading.Thread(target=Update.run, daemon=True).start()
+
+
+class LongPoll(object):
+    """
+    waits at a WeatherPiServer.py for new weather data and refreshes as soon as it lands there instead of waiting for
+    the next update timer
+    """
+    retry = 30
+
+    @staticmethod
+    def start(wait):
+        threading.Thread(target=LongPoll.poll, args=[wait], daemon=True).start()
+
+    @staticmethod
+    def poll(wait):
+        version = None
+
+        while True:
+            request_url = f'{SERVER}/current?key={WEATHERBIT_IO_KEY}{Update.options()}&wait={wait}'
+            headers = dict(HEADERS, **({'If-None-Match': version} if version else {}))
+
+            try:
+                response = requests.get(request_url, headers=headers, timeout=wait + 15)
+
+            except requests.RequestException as poll_ex:
+                logger.warning(f'long polling failed: {poll_ex}')
+                time.sleep(LongPoll.retry)
+                continue
+
+            if 'ETag' not in response.headers:
+                # weatherbit.io itself would answer right away every time and burn api calls
+                logger.warning(f'{SERVER} is not a cache server, long polling stopped')
+                return
+
+            if response.status_code == 200 and version and response.headers['ETag'] != version:
+                logger.info(f'new weather data on {SERVER}')
+                Update.refresh()
+
+            if response.status_code in (200, 304):
+                version = response.headers['ETag']
+            else:
+                time.sleep(LongPoll.retry)
+
+
+def convert_timestamp(timestamp, param_string):
+    """
+    :param timestamp: takes a normal integer unix timestamp
+    :param param_string: use the default convert timestamp to timestring options
+    :return: a converted string from timestamp
+    """
+    timestring = str(datetime.datetime.fromtimestamp(int(timestamp)).astimezone().strftime(param_string))
+
+    return timestring
+
+
+def draw_time_layer():
+    timestamp = Soak.time()
+
+    date_day_string = convert_timestamp(timestamp, theme["DATE_FORMAT"]["DATE"])
+    date_time_string = convert_timestamp(timestamp, theme["DATE_FORMAT"]["TIME"])
+
+    logger.debug(f'Day: {date_day_string}')
+    logger.debug(f'Time: {date_time_string}')
+
+    Layout.render('time', time_surf, {'date': date_day_string, 'clock': date_time_string})
+
+
+def moon_factory(today, size):
+    """
+    :param today: the daily forecast of today
+    :param size: the zoomed size of the moon
+    :return: the moon phase of today from the icon cache
+    """
+    moon_age = get_moon_age(today['ts'])
+
+    key = ('moon', moon_age, size, AA)
+    cached = ICON_CACHE.get(key)
+
+    if cached:
+        return cached
+
+    return ICON_CACHE.put(key, buffer_to_surface(render_moon(moon_age, size, WHITE, DARK_GRAY, AA)))
+
+
+def get_moon_age(timestamp):
+    dt = datetime.datetime.fromtimestamp(timestamp)
+
+    return (((dt.year - 11) % 19) * 11 + [0, 2, 0, 2, 2, 4, 5, 6, 7, 8, 9, 10][dt.month - 1] + dt.day) % 30
+
+
+def render_moon(moon_age, size, light_color, dark_color, aa=False):
+    """
+    draws the moon phase with PIL only, so it can run in a worker process too
+    :return: mode, size and raw pixels of the moon
+    """
+    # based on @miyaichi's fork -> great idea :)
+    # drawn 4 times bigger than needed for smooth edges - a full 1000px moon would be 4MB for every new phase
+    _size = min(1000, size * 4)
+
+    image = Image.new("RGBA", (_size + 2, _size + 2))
+    draw = ImageDraw.Draw(image)
+
+    radius = int(_size / 2)
+
+    # draw full moon
+    draw.ellipse([(1, 1), (_size, _size)], fill=light_color)
+
+    # draw dark side of the moon
+    theta = moon_age / 14.765 * math.pi
+    sum_x = sum_length = 0
+
+    for _y in range(-radius, radius, 1):
+        alpha = math.acos(_y / radius)
+        x = radius * math.sin(alpha)
+        length = radius * math.cos(theta) * math.sin(alpha)
+
+        if moon_age < 15:
+            start = (radius - x, radius + _y)
+            end = (radius + length, radius + _y)
+        else:
+            start = (radius - length, radius + _y)
+            end = (radius + x, radius + _y)
+
+        draw.line((start, end), fill=dark_color)
+
+        sum_x += 2 * x
+        sum_length += end[0] - start[0]
+
+    logger.debug(f'moon phase age: {moon_age} percentage: {round(100 - (sum_length / sum_x) * 100, 1)}')
+
+    image = image.resize((size, size), Image.LANCZOS if aa else Image.BILINEAR)
+
+    return image.mode, image.size, image.tobytes()
+
+
+class Warmup(object):
+    """
+    renders the icons and the moon in worker processes at startup while the first weather data is fetched - the
+    icons of the last weather data are done first, every other weather icon follows in the background
+    """
+    settings = config.get('WARMUP', {})
+    workers = settings.get('WORKERS', os.cpu_count())
+    status_widgets = ('connection', 'refresh', 'path')
+    per_frame = 8
+    pool = None
+    lock = threading.Lock()
+    futures = {}
+    priority = set()
+    started = None
+
+    @staticmethod
+    def start():
+        if not Warmup.workers:
+            return
+
+        priority, background = Warmup.jobs()
+        Warmup.started = time.time()
+
+        # fork before any other thread is started, the workers only need PIL and the render functions
+        Warmup.pool = concurrent.futures.ProcessPoolExecutor(max_workers=Warmup.workers,
+                                                             mp_context=multiprocessing.get_context('fork'))
+
+        for key, (function, *args) in list(priority.items()) + list(background.items()):
+            Warmup.futures[key] = Warmup.pool.submit(function, *args)
 
-        x = int(10 * ZOOM + (offset * ZOOM))
+        Warmup.priority = set(priority)
 
-        self.draw_string(x)
+        logger.info(f'warm up: {len(priority)} priority and {len(background)} background jobs '
+                    f'with {Warmup.workers} workers')
 
-    def right(self, offset=0):
+    @staticmethod
+    def latest():
         """
-        :param offset: define some offset pixel to move strings a little bit more right (default=0)
+        :return: the weather data of the last run to know which icons the first update will need
         """
+        try:
+            with open(LOG_PATH + 'latest_weather.json') as latest_file:
+                data = json.load(latest_file)
+
+            return {
+                'icon': data['current']['data'][0]['weather']['icon'],
+                'forecast_icon_1': data['daily']['data'][1]['weather']['icon'],
+                'forecast_icon_2': data['daily']['data'][2]['weather']['icon'],
+                'forecast_icon_3': data['daily']['data'][3]['weather']['icon'],
+                'wind': data['current']['data'][0]['wind_dir'],
+                'moon': data['daily']['data'][0]
+            }
 
-        x = int((SURFACE_WIDTH - self.size[0] - (10 * ZOOM)) - (offset * ZOOM))
+        except (OSError, ValueError, KeyError, IndexError, TypeError) as latest_ex:
+            logger.info(f'warm up without the last weather data: {latest_ex}')
 
-        self.draw_string(x)
+            return {}
 
-    def center(self, parts, part, offset=0):
+    @staticmethod
+    def jobs():
         """
-        :param parts: define in how many parts you want to split your display
-        :param part: the part in which you want to render text (first part is 0, second is 1, etc.)
-        :param offset: define some offset pixel to move strings a little bit (default=0)
+        :return: the priority and background jobs by their icon cache key
         """
+        latest = Warmup.latest()
+        priority, background = {}, {}
 
-        x = int(((((SURFACE_WIDTH / parts) / 2) + ((SURFACE_WIDTH / parts) * part)) -
-                 (self.size[0] / 2)) + (offset * ZOOM))
+        def add(jobs, name, size, fillcolor=None, angle=None):
+            image_path = ICON_PATH + str(name) + '.png'
+            zoomed_size = int(size * ZOOM)
+            key = (image_path, zoomed_size, angle, fillcolor, AA)
 
-        self.draw_string(x)
+            if os.path.isfile(image_path) and key not in priority and key not in ICON_CACHE.items:
+                jobs[key] = (render_icon, image_path, zoomed_size, fillcolor, angle, AA)
 
-    def draw_string(self, x):
-        """
-        takes x and y from the functions above and render the fonts
-        """
+        for widget in Layout.widgets.values():
+            color = COLORS.get(widget.color)
 
-        self.surf.blit(self.font.render(self.string, True, self.color), (x, self.y))
+            if widget.type == 'image' and widget.image:
+                add(priority, widget.image, widget.size, color)
 
+                if widget.id in Warmup.status_widgets:
+                    for status_color in (RED, GREEN, BLUE):
+                        add(priority, widget.image, widget.size, status_color)
 
-class DrawImage:
-    def __init__(self, surf, image=Image, y=None, size=None, fillcolor=None, angle=None):
-        """
-        :param image: image from the image_factory()
-        :param y: the y-position of the image you want to render
-        """
-        self.image = image
-        if y:
-            self.y = int(y * ZOOM)
-
-        self.img_size = self.image.size
-        self.size = int(size * ZOOM)
-        self.angle = angle
-        self.surf = surf
+            elif widget.type == 'image':
+                if widget.id in latest:
+                    add(priority, latest[widget.id], widget.size, color)
 
-        if angle:
-            self.image = self.image.rotate(self.angle, resample=Image.BICUBIC)
+                for icon in sorted(os.listdir(ICON_PATH)):
+                    add(background, icon.split('.')[0], widget.size, color)
 
-        if size:
-            width, height = self.image.size
-            if width >= height:
-                width, height = (self.size, int(self.size / width * height))
-            else:
-                width, height = (int(self.size / width * height), self.size)
+            elif widget.type == 'wind':
+                add(priority, 'circle', widget.size, WHITE)
 
-            new_image = self.image.resize((width, height), Image.LANCZOS if AA else Image.BILINEAR)
-            self.image = new_image
-            self.img_size = new_image.size
+                if 'wind' in latest:
+                    add(priority, 'arrow', widget.size, color or RED, -latest['wind'])
 
-        self.fillcolor = fillcolor
+            elif widget.type == 'moon' and 'moon' in latest:
+                moon_age = get_moon_age(latest['moon']['ts'])
+                size = int(widget.size * ZOOM)
+                priority[('moon', moon_age, size, AA)] = (render_moon, moon_age, size, WHITE, DARK_GRAY, AA)
 
-        self.image = pygame.image.fromstring(self.image.tobytes(), self.image.size, self.image.mode)
+        return priority, {key: job for key, job in background.items() if key not in priority}
 
     @staticmethod
-    def fill(surface, fillcolor: tuple):
-        """converts the color on an mono colored icon"""
-        surface.set_colorkey(BACKGROUND)
-        w, h = surface.get_size()
-        r, g, b = fillcolor
-        for x in range(w):
-            for y in range(h):
-                a: int = surface.get_at((x, y))[3]
-                # removes some distortion from scaling/zooming
-                if a > 5:
-                    color = pygame.Color(r, g, b, a)
-                    surface.set_at((x, y), color)
-
-    def left(self, offset=0):
+    def collect(wait=False):
         """
-        :param offset: define some offset pixel to move image a little bit more left(default=0)
+        moves the finished jobs to the icon cache - surfaces can only be converted in this process
+        :param wait: blocks until the priority jobs are done, otherwise only a few finished jobs per frame are taken
         """
+        # the render loop never waits for the boot thread that collects the priority jobs
+        if not Warmup.futures or not Warmup.lock.acquire(blocking=wait):
+            return
 
-        x = int(10 * ZOOM + (offset * ZOOM))
+        try:
+            Warmup.take(wait)
+        finally:
+            Warmup.lock.release()
 
-        self.draw_image(x)
+    @staticmethod
+    def take(wait):
+        """moves the finished jobs - must be called while holding the lock"""
+        if wait:
+            concurrent.futures.wait([Warmup.futures[key] for key in Warmup.priority],
+                                    timeout=Warmup.settings.get('TIMEOUT', 10))
 
-    def right(self, offset=0):
-        """
-        :param offset: define some offset pixel to move image a little bit more right (default=0)
-        """
+        done = [key for key, future in Warmup.futures.items() if future.done()]
 
-        x = int((SURFACE_WIDTH - self.img_size[0] - 10 * ZOOM) - (offset * ZOOM))
+        for key in done if wait else done[:Warmup.per_frame]:
+            future = Warmup.futures.pop(key)
+            background = key not in Warmup.priority
+            Warmup.priority.discard(key)
 
-        self.draw_image(x)
+            try:
+                buffer = future.result()
 
-    def center(self, parts, part, offset=0):
-        """
-        :param parts: define in how many parts you want to split your display
-        :param part: the part in which you want to render text (first part is 0, second is 1, etc.)
-        :param offset: define some offset pixel to move strings a little bit (default=0)
-        """
+                if background and not RenderCache.fits(len(buffer[2])):
+                    # the background jobs would only push out the icons that are really used
+                    logger.info(f'warm up stopped, the render caches are full ({len(Warmup.futures)} jobs left)')
+                    Warmup.stop()
+                    return
 
-        x = int(((((SURFACE_WIDTH / parts) / 2) + ((SURFACE_WIDTH / parts) * part)) -
-                 (self.img_size[0] / 2)) + (offset * ZOOM))
+                if key not in ICON_CACHE.items:
+                    ICON_CACHE.put(key, buffer_to_surface(buffer))
+            except Exception as warmup_ex:
+                logger.warning(f'warm up failed for {key}: {warmup_ex}')
 
-        self.draw_image(x)
+        if not Warmup.futures:
+            logger.info(f'warm up done in {round(time.time() - Warmup.started, 2)}s')
+            Warmup.stop()
 
-    def draw_middle_position_icon(self):
+    @staticmethod
+    def stop(wait=False):
+        if Warmup.pool:
+            Warmup.pool.shutdown(wait=wait, cancel_futures=True)
+            Warmup.pool = None
+            Warmup.futures = {}
 
-        position_x = int((SURFACE_WIDTH - ((SURFACE_WIDTH / 3) / 2) - (self.image.get_rect()[2] / 2)))
 
-        position_y = int((self.y - (self.image.get_rect()[3] / 2)))
+def draw_statusbar():
+    global CONNECTION, READING, UPDATING
 
-        self.draw_image(draw_x=position_x, draw_y=position_y)
+    if CONNECTION:
+        Layout.draw(dynamic_surf, 'connection', ('wifi', BLUE))
+        if pygame.time.get_ticks() >= CONNECTION:
+            CONNECTION = None
 
-    def draw_position(self, pos: tuple):
-        x, y = pos
-        if y == 0:
-            y += 1
-        self.draw_image(draw_x=int(x * ZOOM), draw_y=int(y * ZOOM))
+    if UPDATING:
+        Layout.draw(dynamic_surf, 'refresh', ('refresh', BLUE))
+        if pygame.time.get_ticks() >= UPDATING:
+            UPDATING = None
 
-    def draw_absolut_position(self, pos: tuple):
-        x, y = pos
-        if y == 0:
-            y += 1
-        self.draw_image(draw_x=int(x), draw_y=int(y))
+    if READING:
+        Layout.draw(dynamic_surf, 'path', ('path', BLUE))
+        if pygame.time.get_ticks() >= READING:
+            READING = None
 
-    def draw_image(self, draw_x, draw_y=None):
-        """
-        takes x from the functions above and the y from the class to render the image
-        """
 
-        if self.fillcolor:
+def draw_stale():
+    # the last good weather data stays on the display, but shows how old it is
+    age = Fetch.age()
 
-            surface = self.image
-            self.fill(surface, self.fillcolor)
+    if age:
+        Layout.draw(dynamic_surf, 'stale', age)
 
-            if draw_y:
-                self.surf.blit(surface, (int(draw_x), int(draw_y)))
-            else:
-                self.surf.blit(surface, (int(draw_x), self.y))
-        else:
-            if draw_y:
-                self.surf.blit(self.image, (int(draw_x), int(draw_y)))
-            else:
-                self.surf.blit(self.image, (int(draw_x), self.y))
 
+def draw_fps():
+    Layout.draw(dynamic_surf, 'fps', str(int(clock.get_fps())))
 
-class Update(object):
+
+class Capture(object):
+    """
+    takes screenshots and short gif recordings of the display - the frame is only copied in the render loop,
+    encoding and writing the files is done by a background worker
+    """
+    settings = config.get('CAPTURE', {})
+    path = os.path.join(PATH, settings.get('PATH', 'screenshots'))
+    keep = settings.get('KEEP', 20)
+    frames = settings.get('FRAMES', 45)
+    jobs = queue.Queue(maxsize=4)
+    recording = []
+    record_name = None
+    pending = None
+    timer = None
 
     @staticmethod
-    def update_json():
+    def start():
+        os.makedirs(Capture.path, exist_ok=True)
+        threading.Thread(target=Capture.worker, daemon=True).start()
 
-        if PWM:
-            brightness = get_brightness()
-            os.system(f'gpio -g pwm {PWM} {brightness}') if PWM is not False else logger.info('not setting pwm')
-            logger.info(f'set brightness: {brightness}, pwm configured: {PWM}')
+        interval = Capture.settings.get('INTERVAL', False)
+        if interval:
+            Capture.schedule(interval)
 
-        global THREADS, CONNECTION_ERROR, CONNECTION
+    @staticmethod
+    def schedule(interval):
+        # a reload with another INTERVAL ends this chain
+        if interval != Capture.settings.get('INTERVAL', False):
+            return
 
-        thread = threading.Timer(config["TIMER"]["UPDATE"], Update.update_json)
+        Capture.timer = start_timer(interval, Capture.schedule, [interval])
 
-        thread.start()
+        Control.tasks.put(Capture.screenshot)
 
-        THREADS.append(thread)
+    @staticmethod
+    def reload():
+        """takes the new CAPTURE settings - the screenshot timer starts again if the INTERVAL changed"""
+        interval = Capture.settings.get('INTERVAL', False)
 
-        CONNECTION = pygame.time.get_ticks() + 1500  # 1.5 seconds
+        Capture.settings = config.get('CAPTURE', {})
+        Capture.path = os.path.join(PATH, Capture.settings.get('PATH', 'screenshots'))
+        Capture.keep = Capture.settings.get('KEEP', 20)
+        Capture.frames = Capture.settings.get('FRAMES', 45)
 
-        try:
+        os.makedirs(Capture.path, exist_ok=True)
 
-            current_endpoint = f'{SERVER}/current'
-            daily_endpoint = f'{SERVER}/forecast/daily'
-            stats_endpoint = f'{SERVER}/subscription/usage'
-            units = 'M' if METRIC else 'I'
+        if Capture.settings.get('INTERVAL', False) == interval:
+            return
 
-            logger.info(f'connecting to server: {SERVER}')
+        if Capture.timer:
+            Capture.timer.cancel()
 
-            options = str(f'&postal_code={WEATHERBIT_POSTALCODE}'
-                          f'&country={WEATHERBIT_COUNTRY}'
-                          f'&lang={WEATHERBIT_LANG}'
-                          f'&units={units}')
+        interval = Capture.settings.get('INTERVAL', False)
 
-            current_request_url = str(f'{current_endpoint}?key={WEATHERBIT_IO_KEY}{options}')
-            daily_request_url = str(f'{daily_endpoint}?key={WEATHERBIT_IO_KEY}{options}&days={WEATHERBIT_DAYS}')
-            stats_request_url = str(f'{stats_endpoint}?key={WEATHERBIT_IO_KEY}')
+        if interval:
+            Capture.timer = start_timer(interval, Capture.schedule, [interval])
 
-            current_data = requests.get(current_request_url, headers=HEADERS).json()
-            daily_data = requests.get(daily_request_url, headers=HEADERS).json()
-            stats_data = requests.get(stats_request_url, headers=HEADERS).json()
+    @staticmethod
+    def file_name(extension):
+        shot_time = convert_timestamp(time.time(), "%Y-%m-%d %H-%M-%S")
+        return os.path.join(Capture.path, f'screenshot-{shot_time}.{extension}')
 
-            data = {
-                'current': current_data,
-                'daily': daily_data,
-                'stats': stats_data
-            }
+    @staticmethod
+    def screenshot():
+        """copies the next frame and returns the file name it will be saved to"""
+        Capture.pending = Capture.file_name('png')
+        return Capture.pending
 
-            with open(LOG_PATH + 'latest_weather.json', 'w+') as outputfile:
-                json.dump(data, outputfile, indent=2, sort_keys=True)
+    @staticmethod
+    def record():
+        """records the next FRAMES frames as gif and returns the file name it will be saved to"""
+        if Capture.record_name is None:
+            Capture.recording = []
+            Capture.record_name = Capture.file_name('gif')
+        return Capture.record_name
 
-            logger.info('json file saved')
+    @staticmethod
+    def frame(surf):
+        """called with the finished frame from the render loop - only copies the pixels"""
+        if Capture.pending:
+            Capture.put(('png', Capture.pending, surf.get_size(), [pygame.image.tostring(surf, 'RGB')]))
+            Capture.pending = None
+
+        if Capture.record_name:
+            Capture.recording.append(pygame.image.tostring(surf, 'RGB'))
+            if len(Capture.recording) >= Capture.frames:
+                Capture.put(('gif', Capture.record_name, surf.get_size(), Capture.recording))
+                Capture.recording = []
+                Capture.record_name = None
 
-            CONNECTION_ERROR = False
+    @staticmethod
+    def put(job):
+        try:
+            Capture.jobs.put_nowait(job)
+        except queue.Full:
+            logger.warning(f'capture queue full - skipped {job[1]}')
+
+    @staticmethod
+    def worker():
+        while True:
+            kind, file_name, size, frames = Capture.jobs.get()
 
-        except (requests.HTTPError, requests.ConnectionError) as update_ex:
+            try:
+                images = [Image.frombytes('RGB', size, frame) for frame in frames]
 
-            CONNECTION_ERROR = True
+                if kind == 'gif':
+                    images[0].save(file_name, save_all=True, append_images=images[1:], loop=0,
+                                   duration=int(1000 / FPS))
+                else:
+                    images[0].save(file_name)
 
-            logger.warning(f'Connection ERROR: {update_ex}')
+                logger.info(f'Screenshot created at {file_name}')
+
+                Capture.cleanup()
+
+            except (OSError, ValueError) as capture_ex:
+                logger.warning(f'Screenshot failed: {capture_ex}')
 
     @staticmethod
-    def read_json():
+    def cleanup():
+        """removes the oldest screenshots if there are more than KEEP"""
+        if not Capture.keep:
+            return
 
-        global THREADS, JSON_DATA, REFRESH_ERROR, READING
+        shots = sorted(shot for shot in os.listdir(Capture.path) if shot.startswith('screenshot-'))
 
-        thread = threading.Timer(config["TIMER"]["RELOAD"], Update.read_json)
+        for shot in shots[:-Capture.keep]:
+            os.remove(os.path.join(Capture.path, shot))
 
-        thread.start()
 
-        THREADS.append(thread)
+def redraw_weather():
+    """renders the weather surface again from the last data without fetching or reading it"""
+    if JSON_DATA:
+        threading.Thread(target=Update.icon_path, daemon=True).start()
 
-        READING = pygame.time.get_ticks() + 1500  # 1.5 seconds
 
-        try:
+def reload_theme():
+    changed = load_theme(config['THEME'])
 
-            data = open(LOG_PATH + 'latest_weather.json').read()
+    if changed:
+        redraw_weather()
 
-            new_json_data = json.loads(data)
+    return sorted(changed)
 
-            logger.info('json file read by module')
-            logger.info(f'{new_json_data}')
 
-            JSON_DATA = new_json_data
+def reload_layout():
+    Layout.use(Layout.compile(theme['LAYOUT'], FONTS))
+    redraw_weather()
 
-            REFRESH_ERROR = False
+    return theme['LAYOUT']
 
-        except IOError as read_ex:
 
-            REFRESH_ERROR = True
+def reload_config():
+    """
+    reads the config file again and applies everything that can be changed while running
+    display size, framebuffer and ENV still need a restart of the app
+    :return: a list of the changed config and theme sections
+    """
+    global config, SERVER, WEATHERBIT_IO_KEY, HEADERS, WEATHERBIT_COUNTRY, WEATHERBIT_LANG, WEATHERBIT_POSTALCODE, \
+        WEATHERBIT_HOURS, WEATHERBIT_DAYS, METRIC, FPS, SHOW_FPS, AA, ANIMATION
 
-            logger.warning(f'ERROR - json file read by module: {read_ex}')
+    with open(PATH + 'config.json') as config_file:
+        new_config = json.loads(config_file.read())
 
-        Update.icon_path()
+    changed = {key for key in set(new_config) | set(config) if new_config.get(key) != config.get(key)}
 
-    @staticmethod
-    def icon_path():
+    if not changed:
+        return []
 
-        global WEATHERICON, FORECASTICON_DAY_1, \
-            FORECASTICON_DAY_2, FORECASTICON_DAY_3, PRECIPTYPE, PRECIPCOLOR, UPDATING
+    # a running soak test keeps its virtual clock and payloads, so its settings need a restart like ENV
+    for section in ('ENV', 'SOAK'):
+        if section in changed:
+            logger.warning(f'{section} changed - restart the app to apply it')
 
-        icon_extension = '.png'
+    for option in ('WIDTH', 'HEIGHT', 'FRAMEBUFFER', 'PWM'):
+        if new_config['DISPLAY'].get(option) != config['DISPLAY'].get(option):
+            logger.warning(f'DISPLAY {option} changed - restart the app to apply it')
 
-        updated_list = []
+    if 'THEME' in changed:
+        # load the new theme first, so an invalid theme keeps the old config
+        changed |= load_theme(new_config['THEME'])
 
-        icon = JSON_DATA['current']['data'][0]['weather']['icon']
+    config = new_config
 
-        forecast_icon_1 = JSON_DATA['daily']['data'][1]['weather']['icon']
-        forecast_icon_2 = JSON_DATA['daily']['data'][2]['weather']['icon']
-        forecast_icon_3 = JSON_DATA['daily']['data'][3]['weather']['icon']
+    WEATHERBIT_COUNTRY = config['WEATHERBIT_COUNTRY']
+    WEATHERBIT_LANG = config['WEATHERBIT_LANGUAGE']
+    WEATHERBIT_POSTALCODE = config['WEATHERBIT_POSTALCODE']
+    WEATHERBIT_HOURS = config['WEATHERBIT_HOURS']
+    WEATHERBIT_DAYS = config['WEATHERBIT_DAYS']
+    METRIC = config['LOCALE']['METRIC']
 
-        forecast = (str(icon), str(forecast_icon_1), str(forecast_icon_2), str(forecast_icon_3))
+    if config['ENV'] == 'DEV':
+        SERVER = config['MOCKSERVER_URL']
+        WEATHERBIT_IO_KEY = config['WEATHERBIT_DEV_KEY']
+        HEADERS = {'X-Api-Key': f'{config["MOCKSERVER_API_KEY"]}'}
+    else:
+        SERVER = config['WEATHERBIT_URL']
+        WEATHERBIT_IO_KEY = config['WEATHERBIT_DEV_KEY'] if config['ENV'] == 'STAGE' else config['WEATHERBIT_IO_KEY']
+        HEADERS = {}
 
-        logger.debug(forecast)
+    FPS = config['DISPLAY']['FPS']
+    SHOW_FPS = config['DISPLAY']['SHOW_FPS']
+    ANIMATION = config['DISPLAY']['ANIMATION']
 
-        logger.debug(f'validating path: {forecast}')
+    for surface in Pages.surfaces.values():
+        surface.configure(config['DISPLAY'].get('TRANSITION', {}))
 
-        for icon in forecast:
+    if config['DISPLAY']['AA'] != AA:
+        AA = config['DISPLAY']['AA']
+        # icons are resampled with or without antialiasing
+        ICON_CACHE.clear()
 
-            if os.path.isfile(ICON_PATH + icon + icon_extension):
+    # the services only read their settings when they are used, so they take the new ones right away
+    Fetch.settings = config.get('FETCH', {})
+    Sleep.settings = config['DISPLAY'].get('SLEEP', {})
 
-                logger.debug(f'TRUE : {icon}')
+    if 'MEMORY' in changed:
+        Memory.reload()
 
-                updated_list.append(icon)
+    if 'CAPTURE' in changed:
+        Capture.reload()
 
-            else:
+    if 'METRICS' in changed:
+        # the server moves to the new port or host
+        Metrics.stop()
+        Metrics.settings = config.get('METRICS', {})
+        Metrics.start()
 
-                logger.warning(f'FALSE : {icon}')
+    logger.info(f'config reloaded - changed: {sorted(changed)}')
 
-                updated_list.append('unknown')
+    if changed & {'WEATHERBIT_URL', 'MOCKSERVER_URL', 'WEATHERBIT_COUNTRY', 'WEATHERBIT_LANGUAGE',
+                  'WEATHERBIT_POSTALCODE', 'WEATHERBIT_DAYS', 'LOCALE', 'PROVIDER'}:
+        Update.refresh()
+    elif changed - {'TIMER', 'CONTROL_SOCKET'}:
+        redraw_weather()
 
-        WEATHERICON = updated_list[0]
-        FORECASTICON_DAY_1 = updated_list[1]
-        FORECASTICON_DAY_2 = updated_list[2]
-        FORECASTICON_DAY_3 = updated_list[3]
+    return sorted(changed)
 
-        global PATH_ERROR
 
-        if any("unknown" in s for s in updated_list):
+class Watcher(object):
+    files = {}
 
-            PATH_ERROR = True
+    @staticmethod
+    def watch():
+        """
+        checks config and theme file for changes and reloads them between two frames
+        """
+        interval = config['TIMER'].get('WATCH', False)
 
-        else:
+        if not interval:
+            return
 
-            PATH_ERROR = False
+        start_timer(interval, Watcher.watch)
 
-        logger.info(f'update path for icons: {updated_list}')
+        watched = [('config.json', reload_config), (config['THEME'], reload_theme)]
 
-        Update.get_precip_type()
+        if isinstance(theme['LAYOUT'], str):
+            watched.append((theme['LAYOUT'], reload_layout))
+
+        for file_name, reload in watched:
+            try:
+                modified = os.stat(PATH + file_name).st_mtime
+            except OSError:
+                continue
+
+            if Watcher.files.setdefault(file_name, modified) != modified:
+                Watcher.files[file_name] = modified
+                logger.info(f'{file_name} changed')
+                Control.tasks.put(lambda reload=reload: Watcher.reload(reload))
 
     @staticmethod
-    def get_precip_type():
+    def reload(reload):
+        try:
+            reload()
+        except (OSError, ValueError, KeyError, TypeError, pygame.error) as reload_ex:
+            logger.warning(f'reload failed, keeping the old settings: {reload_ex}')
 
-        global JSON_DATA, PRECIPCOLOR, PRECIPTYPE
 
-        pop = int(JSON_DATA['daily']['data'][0]['pop'])
-        rain = float(JSON_DATA['daily']['data'][0]['precip'])
-        snow = float(JSON_DATA['daily']['data'][0]['snow'])
+class Memory(object):
+    """
+    keeps an eye on the memory of the app - samples the resident memory, logs the top allocators of tracemalloc when
+    it grows and clears the caches or restarts the app if it gets over the LIMIT
+    """
+    settings = config.get('MEMORY', {})
+    last_rss = None
+    snapshot = None
+    timer = None
 
-        if pop == 0:
+    @staticmethod
+    def start():
+        if Memory.settings.get('TRACEMALLOC', 0):
+            tracemalloc.start()
 
-            PRECIPTYPE = config['LOCALE']['PRECIP_STR']
-            PRECIPCOLOR = GREEN
+        Memory.watch()
 
-        else:
+    @staticmethod
+    def watch():
+        interval = Memory.settings.get('WATCH', False)
 
-            if pop > 0 and rain > snow:
+        if not interval:
+            return
 
-                PRECIPTYPE = config['LOCALE']['RAIN_STR']
-                PRECIPCOLOR = BLUE
+        Memory.timer = start_timer(interval, Memory.watch)
 
-            elif pop > 0 and snow > rain:
+        Memory.sample()
+
+    @staticmethod
+    def reload():
+        """takes the new MEMORY settings - the watch timer starts again with the new interval"""
+        Memory.settings = config.get('MEMORY', {})
+        RenderCache.budget = Memory.settings.get('BUDGET', 32) * 1024 ** 2
 
-                PRECIPTYPE = config['LOCALE']['SNOW_STR']
-                PRECIPCOLOR = WHITE
+        if Memory.settings.get('TRACEMALLOC', 0) and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not Memory.settings.get('TRACEMALLOC', 0) and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            Memory.snapshot = None
 
-        logger.info(f'update PRECIPPOP to: {pop} %')
-        logger.info(f'update PRECIPTYPE to: {PRECIPTYPE}')
-        logger.info(f'update PRECIPCOLOR to: {PRECIPCOLOR}')
+        if Memory.timer:
+            Memory.timer.cancel()
 
-        Update.create_surface()
+        Memory.watch()
 
     @staticmethod
-    def create_surface():
+    def sample():
+        rss = Soak.rss()
 
-        current_forecast = JSON_DATA['current']['data'][0]
-        daily_forecast = JSON_DATA['daily']['data']
-        stats_data = JSON_DATA['stats']
+        if rss is None:
+            return
 
-        summary_string = current_forecast['weather']['description']
-        temp_out = str(int(current_forecast['temp']))
-        temp_out_unit = '°C' if METRIC else '°F'
-        temp_out_string = str(temp_out + temp_out_unit)
-        precip = JSON_DATA['daily']['data'][0]['pop']
-        precip_string = str(f'{precip} %')
+        limit = Memory.settings.get('LIMIT', False)
 
-        today = daily_forecast[0]
-        day_1 = daily_forecast[1]
-        day_2 = daily_forecast[2]
-        day_3 = daily_forecast[3]
+        if Memory.last_rss is None and limit and rss > limit:
+            # a restart would not help, the app needs more right after the start
+            logger.error(f'memory LIMIT of {limit}MB is below the {round(rss, 1)}MB needed at the start - ignored')
+            Memory.settings = dict(Memory.settings, LIMIT=False)
+            limit = False
 
-        df_forecast = theme["DATE_FORMAT"]["FORECAST_DAY"]
-        df_sun = theme["DATE_FORMAT"]["SUNRISE_SUNSET"]
+        growth = rss - Memory.last_rss if Memory.last_rss is not None else 0
+        Memory.last_rss = rss
 
-        day_1_ts = time.mktime(time.strptime(day_1['datetime'], '%Y-%m-%d'))
-        day_1_ts = convert_timestamp(day_1_ts, df_forecast)
-        day_2_ts = time.mktime(time.strptime(day_2['datetime'], '%Y-%m-%d'))
-        day_2_ts = convert_timestamp(day_2_ts, df_forecast)
-        day_3_ts = time.mktime(time.strptime(day_3['datetime'], '%Y-%m-%d'))
-        day_3_ts = convert_timestamp(day_3_ts, df_forecast)
+        logger.debug(f'memory: {round(rss, 1)}MB, caches: {round(RenderCache.total() / 1024 ** 2, 1)}MB')
 
-        day_1_min_max_temp = f"{int(day_1['low_temp'])} | {int(day_1['high_temp'])}"
-        day_2_min_max_temp = f"{int(day_2['low_temp'])} | {int(day_2['high_temp'])}"
-        day_3_min_max_temp = f"{int(day_3['low_temp'])} | {int(day_3['high_temp'])}"
+        top = Memory.allocators()
 
-        sunrise = convert_timestamp(today['sunrise_ts'], df_sun)
-        sunset = convert_timestamp(today['sunset_ts'], df_sun)
+        if growth >= Memory.settings.get('GROWTH', 16):
+            logger.warning(f'memory grew by {round(growth, 1)}MB to {round(rss, 1)}MB')
 
-        wind_direction = str(current_forecast['wind_cdir'])
-        wind_speed = float(current_forecast['wind_spd'])
-        wind_speed = wind_speed * 3.6 if METRIC else wind_speed
-        wind_speed_unit = 'km/h' if METRIC else 'mph'
-        wind_speed_string = str(f'{round(wind_speed, 1)} {wind_speed_unit}')
+            for stat in top:
+                logger.warning(f'    {stat}')
 
-        global weather_surf, UPDATING
+        if limit and rss > limit:
+            # the caches are used by the render loop, so it has to clean up between two frames
+            Control.tasks.put(Memory.enforce)
+            pygame.event.post(pygame.event.Event(pygame.USEREVENT))
 
-        new_surf = pygame.Surface((SURFACE_WIDTH, SURFACE_HEIGHT))
-        new_surf.fill(BACKGROUND)
+    @staticmethod
+    def allocators():
+        """
+        :return: the lines of the code that allocated the most memory since the last sample
+        """
+        if not tracemalloc.is_tracing():
+            return []
 
-        DrawImage(new_surf, images['wifi'], 5, size=15, fillcolor=RED if CONNECTION_ERROR else GREEN).left()
-        DrawImage(new_surf, images['refresh'], 5, size=15, fillcolor=RED if REFRESH_ERROR else GREEN).right(8)
-        DrawImage(new_surf, images['path'], 5, size=15, fillcolor=RED if PATH_ERROR else GREEN).right(-5)
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        stats = snapshot.compare_to(Memory.snapshot, 'lineno') if Memory.snapshot else snapshot.statistics('lineno')
+        Memory.snapshot = snapshot
 
-        DrawImage(new_surf, images[WEATHERICON], 68, size=100).center(2, 0, offset=10)
+        return stats[:Memory.settings['TRACEMALLOC']]
 
-        if not ANIMATION:
-            if PRECIPTYPE == config['LOCALE']['RAIN_STR']:
+    @staticmethod
+    def enforce():
+        limit = Memory.settings['LIMIT']
+        rss = Soak.rss()
 
-                DrawImage(new_surf, images['preciprain'], size=20).draw_position(pos=(155, 140))
+        if rss <= limit:
+            return
 
-            elif PRECIPTYPE == config['LOCALE']['SNOW_STR']:
+        logger.warning(f'memory {round(rss, 1)}MB over the limit of {limit}MB - clearing all caches')
 
-                DrawImage(new_surf, images['precipsnow'], size=20).draw_position(pos=(155, 140))
+        Warmup.stop()
 
-        DrawImage(new_surf, images[FORECASTICON_DAY_1], 200, size=50).center(3, 0)
-        DrawImage(new_surf, images[FORECASTICON_DAY_2], 200, size=50).center(3, 1)
-        DrawImage(new_surf, images[FORECASTICON_DAY_3], 200, size=50).center(3, 2)
+        for cache in RenderCache.caches:
+            cache.clear()
 
-        DrawImage(new_surf, images['sunrise'], 260, size=25).left()
-        DrawImage(new_surf, images['sunset'], 290, size=25).left()
+        gc.collect()
 
-        draw_wind_layer(new_surf, current_forecast['wind_dir'], 285)
+        try:
+            # glibc keeps freed memory for later, this gives it back to the system
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
 
-        draw_moon_layer(new_surf, int(255 * ZOOM), int(60 * ZOOM))
+        rss = Soak.rss()
 
-        # draw all the strings
-        if config["DISPLAY"]["SHOW_API_STATS"]:
-            DrawString(new_surf, str(stats_data['calls_remaining']), FONT_SMALL_BOLD, BLUE, 20).right(offset=-5)
+        if rss > limit:
+            logger.error(f'memory still {round(rss, 1)}MB over the limit of {limit}MB')
+            quit_all(restart=True)
 
-        DrawString(new_surf, summary_string, FONT_SMALL_BOLD, VIOLET, 50).center(1, 0)
+        logger.info(f'memory back to {round(rss, 1)}MB')
 
-        DrawString(new_surf, temp_out_string, FONT_BIG, ORANGE, 75).right()
 
-        DrawString(new_surf, precip_string, FONT_BIG, PRECIPCOLOR, 105).right()
-        DrawString(new_surf, PRECIPTYPE, FONT_SMALL_BOLD, PRECIPCOLOR, 140).right()
+class Sleep(object):
+    """
+    switches the display off by a schedule or at night from sunset to sunrise - the render loop and the animation are
+    suspended, only the weather updates keep running, so the weather surface is ready when the display wakes up
+    """
+    settings = config['DISPLAY'].get('SLEEP', {})
+    sleeping = False
+    forced = False
+    woken_until = 0
+    waking = False
 
-        DrawString(new_surf, day_1_ts, FONT_SMALL_BOLD, ORANGE, 165).center(3, 0)
-        DrawString(new_surf, day_2_ts, FONT_SMALL_BOLD, ORANGE, 165).center(3, 1)
-        DrawString(new_surf, day_3_ts, FONT_SMALL_BOLD, ORANGE, 165).center(3, 2)
+    @staticmethod
+    def scheduled(timestamp):
+        """
+        :param timestamp: unix timestamp to check
+        :return: True if the display should sleep by the schedule or the sun
+        """
+        if Sleep.settings.get('SUN', False):
+            try:
+                today = JSON_DATA['daily']['data'][0]
+                offset = Sleep.settings.get('SUN_OFFSET', 3600)
+                if timestamp >= int(today['sunset_ts']) + offset or timestamp <= int(today['sunrise_ts']) - offset:
+                    return True
+            except (KeyError, IndexError, TypeError, ValueError):
+                pass
 
-        DrawString(new_surf, day_1_min_max_temp, FONT_SMALL_BOLD, MAIN_FONT, 180).center(3, 0)
-        DrawString(new_surf, day_2_min_max_temp, FONT_SMALL_BOLD, MAIN_FONT, 180).center(3, 1)
-        DrawString(new_surf, day_3_min_max_temp, FONT_SMALL_BOLD, MAIN_FONT, 180).center(3, 2)
+        now = datetime.datetime.fromtimestamp(timestamp)
+        hour = now.hour + now.minute / 60
 
-        DrawString(new_surf, sunrise, FONT_SMALL_BOLD, MAIN_FONT, 265).left(30)
-        DrawString(new_surf, sunset, FONT_SMALL_BOLD, MAIN_FONT, 292).left(30)
+        for start, end in Sleep.settings.get('SCHEDULE', []):
+            # a schedule like [23, 6] goes over midnight
+            if start <= hour < end if start <= end else hour >= start or hour < end:
+                return True
 
-        DrawString(new_surf, wind_direction, FONT_SMALL_BOLD, MAIN_FONT, 250).center(3, 2)
-        DrawString(new_surf, wind_speed_string, FONT_SMALL_BOLD, MAIN_FONT, 300).center(3, 2)
+        return False
 
-        weather_surf = new_surf
+    @staticmethod
+    def check():
+        """
+        :return: True if the display should sleep now
+        """
+        now = Soak.time()
 
-        logger.info(f'summary: {summary_string}')
-        logger.info(f'temp out: {temp_out_string}')
-        logger.info(f'{PRECIPTYPE}: {precip_string}')
-        logger.info(f'icon: {WEATHERICON}')
-        logger.info(f'forecast: '
-                    f'{day_1_ts} {day_1_min_max_temp} {FORECASTICON_DAY_1}; '
-                    f'{day_2_ts} {day_2_min_max_temp} {FORECASTICON_DAY_2}; '
-                    f'{day_3_ts} {day_3_min_max_temp} {FORECASTICON_DAY_3}')
-        logger.info(f'sunrise: {sunrise} ; sunset {sunset}')
-        logger.info(f'WindSpeed: {wind_speed_string}')
+        if now < Sleep.woken_until:
+            sleeping = False
+        else:
+            sleeping = Sleep.forced or Sleep.scheduled(now)
 
-        # remove the ended timer and threads
-        global THREADS
-        THREADS = [t for t in THREADS if t.is_alive()]
-        logging.info(f'threads cleaned: {len(THREADS)} left in the queue')
+        if sleeping != Sleep.sleeping:
+            logger.info(f'display {"goes to sleep" if sleeping else "wakes up"}')
 
-        pygame.time.delay(1500)
-        UPDATING = pygame.time.get_ticks() + 1500  # 1.5 seconds
+        Sleep.sleeping = sleeping
 
-        return weather_surf
+        return sleeping
 
     @staticmethod
-    def run():
-        Update.update_json()
-        Update.read_json()
+    def sleep():
+        Sleep.forced = True
+        Sleep.woken_until = 0
 
+        return 'sleeping'
 
-def get_brightness():
-    current_time = time.time()
-    current_time = int(convert_timestamp(current_time, '%H'))
+    @staticmethod
+    def wake():
+        """wakes the display for WAKE seconds - also within a sleep schedule if it was sent to sleep by hand"""
+        Sleep.woken_until = Soak.time() + Sleep.settings.get('WAKE', 60)
+        Sleep.forced = False
 
-    return 25 if current_time >= 20 or current_time <= 5 else 100
+        return 'awake'
 
+    @staticmethod
+    def suspend():
+        """blanks the display and waits for events without rendering until the display wakes up"""
+        panel_surf.fill(BLACK)
+        pygame.display.update()
+        # the render thread never waits for a fade
+        brightness.nudge()
 
-def convert_timestamp(timestamp, param_string):
-    """
-    :param timestamp: takes a normal integer unix timestamp
-    :param param_string: use the default convert timestamp to timestring options
-    :return: a converted string from timestamp
-    """
-    timestring = str(datetime.datetime.fromtimestamp(int(timestamp)).astimezone().strftime(param_string))
+        while Sleep.check():
+            # blocks until something happens - the control socket posts an event for every command
+            event = pygame.event.wait(1000)
 
-    return timestring
+            if event.type == pygame.QUIT or event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                quit_all()
 
+            elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.KEYDOWN):
+                Sleep.wake()
 
-def draw_time_layer():
-    timestamp = time.time()
+            Control.process()
 
-    date_day_string = convert_timestamp(timestamp, theme["DATE_FORMAT"]["DATE"])
-    date_time_string = convert_timestamp(timestamp, theme["DATE_FORMAT"]["TIME"])
+        # the first frame is drawn with the backlight still off, then it is switched on
+        Sleep.waking = True
 
-    logger.debug(f'Day: {date_day_string}')
-    logger.debug(f'Time: {date_time_string}')
+    @staticmethod
+    def woke():
+        if Sleep.waking:
+            Sleep.waking = False
+            brightness.nudge(0)
+
+
+def get_stats():
+    return {
+        'fps': round(clock.get_fps(), 1),
+        'threads': len(THREADS),
+        'connection_error': CONNECTION_ERROR,
+        'refresh_error': REFRESH_ERROR,
+        'path_error': PATH_ERROR,
+        'calls_remaining': JSON_DATA.get('stats', {}).get('calls_remaining'),
+        'brightness': brightness.current,
+        'uptime': round(time.time() - START_TIME),
+        'theme': config['THEME'],
+        'blit_ms': {layer: round(blit_time, 3) for layer, blit_time in LAYER_TIMES.items()},
+        'text_cache': {'items': len(TEXT_CACHE.items), 'hits': TEXT_CACHE.hits, 'misses': TEXT_CACHE.misses},
+        'icon_cache': {'items': len(ICON_CACHE.items), 'hits': ICON_CACHE.hits, 'misses': ICON_CACHE.misses},
+        'warmup_pending': len(Warmup.futures),
+        'sleeping': Sleep.sleeping,
+        'memory': {'rss': round(Soak.rss() or 0, 1), 'caches': round(RenderCache.total() / 1024 ** 2, 1),
+                   'budget': round(RenderCache.budget / 1024 ** 2, 1),
+                   'evictions': sum(cache.evictions for cache in RenderCache.caches)},
+        'fetch': {'failures': Fetch.failures, 'circuit': 'open' if Fetch.is_open() else 'closed',
+                  'provider': JSON_DATA.get('provider'), 'answers': dict(Providers.answers),
+                  'age': round(Soak.time() - Fetch.fetched) if Fetch.fetched else None}
+    }
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        """reads one command per line and answers with a json line"""
+        for line in self.rfile:
+            command = line.decode('utf-8').strip()
+
+            if not command:
+                continue
+
+            if command not in Control.commands:
+                answer = {'ok': False, 'error': f'unknown command: {command}'}
+            else:
+                answer = Control.request(command)
 
-    DrawString(time_surf, date_day_string, DATE_FONT, MAIN_FONT, 0).center(1, 0)
-    DrawString(time_surf, date_time_string, CLOCK_FONT, MAIN_FONT, 15).center(1, 0)
+            self.wfile.write((json.dumps(answer) + '\n').encode('utf-8'))
 
 
-def draw_moon_layer(surf, y, size):
-    # based on @miyaichi's fork -> great idea :)
-    _size = 1000
-    dt = datetime.datetime.fromtimestamp(JSON_DATA['daily']['data'][0]['ts'])
-    moon_age = (((dt.year - 11) % 19) * 11 + [0, 2, 0, 2, 2, 4, 5, 6, 7, 8, 9, 10][dt.month - 1] + dt.day) % 30
+class Control(object):
+    """
+    local unix socket api to control the running app (e.g. from PiButtons.py) -
+    commands are queued and run by the render loop between two frames
+    """
+    commands = {
+        'ping': lambda: 'pong',
+        'refresh': lambda: Update.refresh(),
+        'reload_theme': lambda: reload_theme(),
+        'reload_config': lambda: reload_config(),
+        'screenshot': lambda: Capture.screenshot(),
+        'record': lambda: Capture.record(),
+        'stats': lambda: get_stats(),
+        'sleep': lambda: Sleep.sleep(),
+        'wake': lambda: Sleep.wake(),
+        'next_page': lambda: Pages.step(1),
+        'previous_page': lambda: Pages.step(-1)
+    }
+    tasks = queue.Queue()
+    server = None
+    timeout = 5
 
-    image = Image.new("RGBA", (_size + 2, _size + 2))
-    draw = ImageDraw.Draw(image)
+    @staticmethod
+    def start(socket_path):
+        if not socket_path:
+            logger.info('no control socket configured')
+            return
 
-    radius = int(_size / 2)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
 
-    # draw full moon
-    draw.ellipse([(1, 1), (_size, _size)], fill=WHITE)
+        Control.server = socketserver.ThreadingUnixStreamServer(socket_path, ControlHandler)
+        Control.server.daemon_threads = True
 
-    # draw dark side of the moon
-    theta = moon_age / 14.765 * math.pi
-    sum_x = sum_length = 0
+        # only the user of the app may send commands
+        os.chmod(socket_path, 0o600)
 
-    for _y in range(-radius, radius, 1):
-        alpha = math.acos(_y / radius)
-        x = radius * math.sin(alpha)
-        length = radius * math.cos(theta) * math.sin(alpha)
+        threading.Thread(target=Control.server.serve_forever, daemon=True).start()
 
-        if moon_age < 15:
-            start = (radius - x, radius + _y)
-            end = (radius + length, radius + _y)
-        else:
-            start = (radius - length, radius + _y)
-            end = (radius + x, radius + _y)
+        logger.info(f'control socket listening on {socket_path}')
 
-        draw.line((start, end), fill=DARK_GRAY)
+    @staticmethod
+    def stop():
+        if Control.server:
+            Control.server.shutdown()
+            Control.server.server_close()
+            os.remove(Control.server.server_address)
+            Control.server = None
 
-        sum_x += 2 * x
-        sum_length += end[0] - start[0]
+    @staticmethod
+    def request(command):
+        """queues the command for the render loop and waits for its result"""
+        done = threading.Event()
+        answer = {'ok': False, 'error': 'timeout - render loop not responding'}
 
-    logger.debug(f'moon phase age: {moon_age} percentage: {round(100 - (sum_length / sum_x) * 100, 1)}')
+        def run():
+            try:
+                answer.update(ok=True, result=Control.commands[command]())
+                answer.pop('error')
+            except Exception as command_ex:
+                answer.update(error=str(command_ex))
+                logger.warning(f'control command {command} failed: {command_ex}')
+            done.set()
 
-    image = image.resize((size, size), Image.LANCZOS if AA else Image.BILINEAR)
-    image = pygame.image.fromstring(image.tobytes(), image.size, image.mode)
+        Control.tasks.put(run)
 
-    x = (SURFACE_WIDTH / 2) - (size / 2)
+        # wakes up the render loop if it waits for events while the display sleeps
+        pygame.event.post(pygame.event.Event(pygame.USEREVENT))
 
-    surf.blit(image, (x, y))
+        if not done.wait(Control.timeout):
+            with Control.tasks.mutex:
+                if run in Control.tasks.queue:
+                    # the client gets the timeout, so the command must not run later on
+                    Control.tasks.queue.remove(run)
+                    return answer
 
+            # the render loop has just taken it, its answer follows right away
+            done.wait(Control.timeout)
 
-def draw_wind_layer(surf, angle, y):
-    # center the wind direction icon and circle on surface
-    DrawImage(surf, images['circle'], y, size=30, fillcolor=WHITE).draw_middle_position_icon()
-    DrawImage(surf, images['arrow'], y, size=30, fillcolor=RED, angle=-angle).draw_middle_position_icon()
+        return dict(answer)
 
-    logger.debug(f'wind direction: {angle}')
+    @staticmethod
+    def process():
+        """
+        runs all queued commands - called from the render loop
+        :return: True if any command was run
+        """
+        processed = False
 
+        while not Control.tasks.empty():
+            Control.tasks.get_nowait()()
+            processed = True
 
-def draw_statusbar():
-    global CONNECTION, READING, UPDATING
+        return processed
 
-    if CONNECTION:
-        DrawImage(dynamic_surf, images['wifi'], 5, size=15, fillcolor=BLUE).left()
-        if pygame.time.get_ticks() >= CONNECTION:
-            CONNECTION = None
 
-    if UPDATING:
-        DrawImage(dynamic_surf, images['refresh'], 5, size=15, fillcolor=BLUE).right(8)
-        if pygame.time.get_ticks() >= UPDATING:
-            UPDATING = None
+def draw_placeholder():
+    """
+    draws the weather layout without weather data for the first frame - only shapes and text, so it shows up before
+    any icon is decoded
+    """
+    with weather.lock:
+        weather.back.fill(BACKGROUND)
 
-    if READING:
-        DrawImage(dynamic_surf, images['path'], 5, size=15, fillcolor=BLUE).right(-5)
-        if pygame.time.get_ticks() >= READING:
-            READING = None
+        for widget in Layout.layers.get('weather', []):
+            # the icons of the weather data are outlined, the fixed status icons are left out
+            if widget.type in ('image', 'wind', 'moon') and not widget.image:
+                size = int(widget.size * ZOOM)
+                x, y = widget.position((size, size))
+                pygame.draw.circle(weather.back, DARK_GRAY, (x + size // 2, y + size // 2), size // 2, max(1, int(ZOOM)))
 
+        Layout.draw(weather.back, 'summary', config['LOCALE'].get('LOADING_STR', 'Loading...'))
 
-def draw_fps():
-    DrawString(dynamic_surf, str(int(clock.get_fps())), FONT_SMALL_BOLD, RED, 20).left()
+        weather.publish(None)
 
 
-# ToDo: make this useful for touch events
-def draw_event(color=RED):
+def boot():
+    """fetches while the workers render the icons, then draws the first update from the warmed cache"""
+    with Startup.phase('fetch'):
+        Update.update_json()
 
-    pos = pygame.mouse.get_pos()
+    with Startup.phase('warm up icons'):
+        Warmup.collect(wait=True)
 
-    size = 20
-    radius = int(size / 2)
-    new_pos = (int(pos[0] - FIT_SCREEN[0] - (radius * ZOOM)), int(pos[1] - FIT_SCREEN[1] - (radius * ZOOM)))
-    DrawImage(mouse_surf, images['circle'], size=size, fillcolor=color).draw_absolut_position(new_pos)
+    with Startup.phase('read and render'):
+        Update.read_json()
 
+    if config['TIMER'].get('LONG_POLL'):
+        LongPoll.start(config['TIMER']['LONG_POLL'])
 
-def create_scaled_surf(surf, aa=False):
-    if aa:
-        scaled_surf = pygame.transform.smoothscale(surf, (SURFACE_WIDTH, SURFACE_HEIGHT))
-    else:
-        scaled_surf = pygame.transform.scale(surf, (SURFACE_WIDTH, SURFACE_HEIGHT))
 
-    return scaled_surf
+def loop():
+    Soak.start()
 
+    with Startup.phase('warm up start'):
+        Warmup.start()
 
-def loop():
-    Update.run()
+    with Startup.phase('services'):
+        brightness.run()
+        Control.start(config.get('CONTROL_SOCKET', '/tmp/WeatherPiTFT.sock'))
+        Metrics.start()
+        Memory.start()
+        Watcher.watch()
+        Capture.start()
+
+    # the first frame shows the clock and the placeholder, the weather data and the icons follow in the background
+    with Startup.phase('placeholder'):
+        draw_placeholder()
+
+    threading.Thread(target=boot, name='boot', daemon=True).start()
 
     running = True
+    full_update = True
 
     while running:
-        tft_surf.fill(BACKGROUND)
+        if Sleep.check():
+            Sleep.suspend()
+            full_update = True
+
+        frame_start = time.perf_counter()
 
         # fill the actual main surface and blit the image/weather layer
         display_surf.fill(BACKGROUND)
-        display_surf.blit(weather_surf, (0, 0))
+        full_update = weather.swap() or full_update
+        full_update = Pages.swap() or full_update
+        full_update = Pages.surface().draw(display_surf) or full_update
 
         # fill the dynamic layer, make it transparent and use draw functions that write to that surface
         dynamic_surf.fill(BACKGROUND)
         dynamic_surf.set_colorkey(BACKGROUND)
 
         draw_statusbar()
+        draw_stale()
 
         if SHOW_FPS:
             draw_fps()
 
-        if ANIMATION:
-            my_particles.move(dynamic_surf, my_particles_list)
+        if ANIMATION and Pages.surface() is weather:
+            my_particles.move(dynamic_surf, my_particles_list, weather.state)
 
         # finally take the dynamic surface and blit it to the main surface
-        display_surf.blit(dynamic_surf, (0, 0))
+        timed_blit('dynamic', display_surf, dynamic_surf, (0, 0))
 
         # now do the same for the time layer so it did not interfere with the other layers
         # fill the layer and make it transparent as well
@@ -979,12 +3588,7 @@ def loop():
 
         # draw the time to the main layer
         draw_time_layer()
-        display_surf.blit(time_surf, (0, 0))
-
-        # # draw the mouse events
-        # mouse_surf.fill(BACKGROUND)
-        # mouse_surf.set_colorkey(BACKGROUND)
-        # draw_event(WHITE)
+        timed_blit('time', display_surf, time_surf, (0, 0))
 
         for event in pygame.event.get():
 
@@ -994,10 +3598,18 @@ def loop():
 
                 quit_all()
 
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE):
+
+                full_update = True
+
             elif event.type == pygame.MOUSEBUTTONDOWN:
 
-                if pygame.MOUSEBUTTONDOWN:
-                    draw_event()
+                Touch.down(event.pos)
+
+            elif event.type == pygame.MOUSEBUTTONUP:
+
+                # a new page is already rendered and gets blitted with a full update in the next frame
+                Touch.up(event.pos)
 
             elif event.type == pygame.KEYDOWN:
 
@@ -1008,31 +3620,64 @@ def loop():
                     quit_all()
 
                 elif event.key == pygame.K_SPACE:
-                    shot_time = convert_timestamp(time.time(), "%Y-%m-%d %H-%M-%S")
-                    pygame.image.save(display_surf, f'screenshot-{shot_time}.png')
-                    logger.info(f'Screenshot created at {shot_time}')
+                    Capture.screenshot()
 
-        # display_surf.blit(mouse_surf, (0, 0))
+                elif event.key == pygame.K_g:
+                    Capture.record()
 
-        # finally take the main surface and blit it to the tft surface
-        tft_surf.blit(create_scaled_surf(display_surf, aa=AA), FIT_SCREEN)
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    Pages.step(1 if event.key == pygame.K_RIGHT else -1)
 
-        # update the display with all surfaces merged into the main one
-        pygame.display.update()
+        full_update = Control.process() or full_update
+        Warmup.collect()
+        Capture.frame(display_surf)
+
+        if full_update:
+            # finally take the main surface and blit it to the tft surface
+            tft_surf.fill(BACKGROUND)
+            timed_blit('display', tft_surf, display_surf, FIT_SCREEN)
+
+            # update the display with all surfaces merged into the main one
+            present()
+            full_update = False
+        else:
+            # only the time, status bar, fps and particles change between two weather updates
+            dirty_rects = Layout.layer_rects('time') + Layout.layer_rects('dynamic') + \
+                Layout.rects('connection', 'refresh', 'path')
+            dirty_rects = [rect.move(FIT_SCREEN) for rect in dirty_rects]
+
+            start = time.perf_counter()
+            for rect in dirty_rects:
+                tft_surf.blit(display_surf, rect, rect.move(-FIT_SCREEN[0], -FIT_SCREEN[1]))
+            LAYER_TIMES['display'] = LAYER_TIMES.get('display', 0) * 0.95 + \
+                (time.perf_counter() - start) * 1000 * 0.05
+
+            present(dirty_rects)
+
+        Sleep.woke()
+
+        if Startup.pending:
+            Startup.frame(weather.state is not None)
+
+        frame_time = (time.perf_counter() - frame_start) * 1000
+        Metrics.frame(frame_time)
+
+        if Soak.replay and not Soak.frame(frame_time):
+            running = False
 
         # do it as often as FPS configured (30 FPS recommend for particle simulation, 15 runs fine too, 60 is overkill)
         clock.tick(FPS)
 
-    quit_all()
+    quit_all(1 if Soak.failures else 0)
 
 
 if __name__ == '__main__':
 
     try:
 
-        if ANIMATION:
-            my_particles = Particles()
-            my_particles_list = my_particles.create_particle_list()
+        # the particles are created even without ANIMATION, it can be turned on by a config reload
+        my_particles = Particles()
+        my_particles_list = my_particles.create_particle_list()
 
         images = image_factory(ICON_PATH)
 